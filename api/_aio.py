@@ -0,0 +1,455 @@
+"""
+asyncio-native fetch engine: watch page -> token -> /next -> parse.
+
+Upstream requests use a small HTTP/1.1 client on raw asyncio streams with
+a keep-alive connection pool, so one process can keep hundreds of upstream
+requests in flight. Only the I/O is async: the crawl itself is the one in
+_crawl that comments.py runs too, driven here by perform().
+"""
+from urllib.parse import urlsplit
+import asyncio
+import functools
+import os
+import ssl
+import time
+import weakref
+
+from api import _crawl, _governor, _jsonscan, _metrics, _scan, _service
+from api._crawl import PAGE_FLIGHTS, REPLY_FANOUT, FetchError
+from api._upstream import RAW_CHUNK_SIZE, ContentDecoder, UpstreamHTTPError, with_accept_encoding
+
+
+class AsyncResponse:
+    """
+    Response body reader supporting Content-Length, chunked and
+    read-until-close framing, and gzip/deflate/br content encoding. On
+    close the connection goes back to the pool if the body was fully
+    read, otherwise it is discarded.
+    """
+
+    def __init__(self, pool, key, conn, status, reason, headers, permit=None):
+        self._pool = pool
+        self._permit = permit
+        self._key = key
+        self._conn = conn
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.bytes_read = 0
+        self._decoder = ContentDecoder.for_headers(headers)
+        self._finished = False
+        self._done = False
+        self._chunk_left = 0
+        self._chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        self._remaining = None
+        if not self._chunked and 'content-length' in headers:
+            self._remaining = int(headers['content-length'])
+            self._done = self._remaining == 0
+        self._will_close = (
+            headers.get('connection', '').lower() == 'close'
+            or (not self._chunked and self._remaining is None)
+        )
+
+    async def read(self, amt=-1):
+        """Read up to amt bytes of the decoded body (everything if amt < 0)"""
+        if amt < 0:
+            parts = []
+            while True:
+                part = await self.read(_scan.CHUNK_SIZE)
+                if not part:
+                    return b''.join(parts)
+                parts.append(part)
+
+        if self._decoder is None:
+            return await self._read_raw(amt)
+        while True:
+            data = self._decoder.take(amt)
+            if data or self._finished:
+                return data
+            raw = await self._read_raw(RAW_CHUNK_SIZE)
+            if not raw:
+                self._finished = True
+                self._decoder.end()
+                return self._decoder.take(amt)
+            self._decoder.feed(raw)
+
+    async def _read_raw(self, amt):
+        """Read up to amt bytes of the body as sent"""
+        if self._done or amt == 0:
+            return b''
+        reader = self._conn[0]
+
+        if self._chunked:
+            if self._chunk_left == 0:
+                size_line = await reader.readline()
+                self._chunk_left = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+                if self._chunk_left == 0:
+                    # Skip trailers up to the blank line ending the body
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    self._done = True
+                    return b''
+            data = await reader.read(min(amt, self._chunk_left))
+            if not data:
+                raise asyncio.IncompleteReadError(data, self._chunk_left)
+            self._chunk_left -= len(data)
+            if self._chunk_left == 0:
+                await reader.readexactly(2)
+            self.bytes_read += len(data)
+            return data
+
+        if self._remaining is not None:
+            data = await reader.read(min(amt, self._remaining))
+            if not data:
+                raise asyncio.IncompleteReadError(data, self._remaining)
+            self._remaining -= len(data)
+            self._done = self._remaining == 0
+            self.bytes_read += len(data)
+            return data
+
+        data = await reader.read(amt)
+        if not data:
+            self._done = True
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        _metrics.count_response(self.status, self.bytes_read)
+        if self._done and not self._will_close:
+            self._pool._release(self._key, conn)
+        else:
+            conn[1].close()
+        self._pool._slot(self._key).release()
+        if self._permit is not None:
+            self._permit(self.status)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class AsyncConnectionPool:
+    """
+    Keep-alive pool of (reader, writer) stream pairs keyed by
+    (scheme, host, port), with the same limits as the sync ConnectionPool:
+    max_per_host idle connections, idle_timeout eviction, an optional
+    cap on requests in flight per host and an optional shared governor.
+    A pool belongs to one event loop.
+    """
+
+    def __init__(self, max_per_host=32, idle_timeout=30.0, max_in_flight=None, governor=None):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.max_in_flight = max_in_flight
+        self.governor = governor
+        self._idle = {}
+        self._slots = {}
+        self._ssl = ssl.create_default_context()
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+
+    async def request(self, method, url, body=None, headers=None, timeout=15):
+        """
+        Send a request and return an AsyncResponse once its headers arrive.
+        Raises UpstreamHTTPError for 4xx/5xx responses.
+        """
+        governor = self.governor
+        if governor is None:
+            return await self._request(method, url, body, headers, timeout)
+
+        host = urlsplit(url).hostname
+        attempt = 0
+        while True:
+            await governor.acquire_async(host, timeout)
+            try:
+                return await self._request(method, url, body, headers, timeout,
+                                           functools.partial(governor.release, host))
+            except UpstreamHTTPError as e:
+                retry_after = _governor.retry_after_seconds(e.headers)
+                governor.release(host, e.status, retry_after)
+                if e.status not in _governor.RETRY_STATUSES or attempt >= governor.max_retries:
+                    raise
+            except BaseException:
+                governor.release(host)
+                raise
+            attempt += 1
+            await asyncio.sleep(governor.retry_delay(host, attempt, retry_after))
+
+    async def _request(self, method, url, body, headers, timeout, permit=None):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        host = parts.hostname if parts.port is None else f'{parts.hostname}:{parts.port}'
+        head = [f'{method} {path} HTTP/1.1', f'Host: {host}']
+        for name, value in with_accept_encoding(headers).items():
+            head.append(f'{name}: {value}')
+        if body is not None:
+            head.append(f'Content-Length: {len(body)}')
+        request = ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + (body or b'')
+
+        slot = self._slot(key)
+        await slot.acquire()
+        try:
+            conn, status, reason, response_headers = await asyncio.wait_for(
+                self._send(key, request), timeout
+            )
+        except BaseException:
+            slot.release()
+            raise
+
+        if status >= 400:
+            # Drain small error bodies so the connection can be reused; the
+            # caller returns the permit with the error status
+            response = AsyncResponse(self, key, conn, status, reason, response_headers)
+            try:
+                await asyncio.wait_for(response.read(), timeout)
+            finally:
+                response.close()
+            raise UpstreamHTTPError(status, reason, response_headers)
+        return AsyncResponse(self, key, conn, status, reason, response_headers, permit)
+
+    async def _send(self, key, request):
+        conn, reused = await self._acquire(key)
+        try:
+            return (conn,) + await self._exchange(conn, request)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            conn[1].close()
+            if not reused:
+                raise
+        except BaseException:
+            conn[1].close()
+            raise
+
+        # The server closed the idle socket; retry once on a new one
+        self.reconnects += 1
+        conn = await self._connect(key)
+        try:
+            return (conn,) + await self._exchange(conn, request)
+        except BaseException:
+            conn[1].close()
+            raise
+
+    async def _exchange(self, conn, request):
+        reader, writer = conn
+        writer.write(request)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed before response')
+        _, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return int(status), reason, headers
+
+    async def _acquire(self, key):
+        now = time.monotonic()
+        conns = self._idle.get(key, [])
+        while conns:
+            conn, released_at = conns.pop()
+            if now - released_at > self.idle_timeout or conn[0].at_eof():
+                conn[1].close()
+                self.evictions += 1
+                continue
+            self.hits += 1
+            return conn, True
+        self.misses += 1
+        return await self._connect(key), False
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return await asyncio.open_connection(host, port, ssl=self._ssl, server_hostname=host)
+        return await asyncio.open_connection(host, port)
+
+    def _release(self, key, conn):
+        conns = self._idle.setdefault(key, [])
+        if len(conns) < self.max_per_host:
+            conns.append((conn, time.monotonic()))
+        else:
+            conn[1].close()
+            self.evictions += 1
+
+    def _slot(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = asyncio.Semaphore(self.max_in_flight or 1 << 30)
+        return slot
+
+    def stats(self):
+        """Return pool counters and the number of idle connections"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reconnects': self.reconnects,
+            'evictions': self.evictions,
+            'idle': sum(len(conns) for conns in self._idle.values())
+        }
+
+    def close(self):
+        """Close every idle connection"""
+        for conns in self._idle.values():
+            for (_, writer), _ in conns:
+                writer.close()
+        self._idle = {}
+
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_pool():
+    """The connection pool of the running event loop"""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = AsyncConnectionPool(
+            max_per_host=int(os.environ.get('UPSTREAM_ASYNC_POOL_SIZE', '64')),
+            idle_timeout=float(os.environ.get('UPSTREAM_POOL_IDLE_TIMEOUT', '30')),
+            max_in_flight=int(os.environ.get('UPSTREAM_ASYNC_MAX_IN_FLIGHT', '256')) or None,
+            governor=_governor.GOVERNOR
+        )
+    return pool
+
+
+async def fetch_continuation_token(video_id):
+    """Async version of comments.fetch_continuation_token"""
+    video_url, headers = _crawl.watch_request(video_id)
+    try:
+        with _metrics.stage('watch'):
+            response = await get_pool().request('GET', video_url, headers=headers, timeout=15)
+        async with response:
+            with _metrics.stage('watch_scan'):
+                # Each scan gets its own buffer; coroutines share this thread
+                scanner = _scan.Scanner(_scan.WATCH_PAGE_PATTERNS, required=('token',))
+                while True:
+                    view = scanner.space()
+                    try:
+                        data = await asyncio.wait_for(response.read(len(view)), 15)
+                        view[:len(data)] = data
+                    finally:
+                        view.release()
+                    if not data or scanner.advance(len(data)):
+                        break
+    except Exception as e:
+        raise FetchError(f'Failed to fetch video: {str(e)}')
+    return _crawl.watch_token(scanner.found)
+
+
+async def fetch_next_page(continuation_token, probe=False):
+    """Async version of comments.fetch_next_page, coalesced per token"""
+    return await PAGE_FLIGHTS.do_async(('next', continuation_token), _fetch_next_page, continuation_token, probe)
+
+
+async def _fetch_next_page(continuation_token, probe=False):
+    url, body, headers = _crawl.next_request(continuation_token)
+    try:
+        with _metrics.stage('next'):
+            response = await get_pool().request('POST', url, body=body, headers=headers, timeout=15)
+        async with response:
+            with _metrics.stage('next_scan'):
+                return await asyncio.wait_for(_scan_page(response), 15)
+    except Exception as e:
+        raise _crawl.next_error(e, probe)
+
+
+async def _scan_page(response):
+    """Async version of _jsonscan.scan_page"""
+    decoder = _jsonscan.PageDecoder()
+    while True:
+        data = await response.read(_scan.CHUNK_SIZE)
+        if not data:
+            break
+        decoder.feed(data)
+    return decoder.close()
+
+
+async def fetch_first_page(video_id, order='top'):
+    """Async version of comments.fetch_first_page"""
+    return await PAGE_FLIGHTS.do_async(('first', video_id, order), _run_first_page, video_id, order)
+
+
+async def _run_first_page(video_id, order):
+    return await _crawl.run_async(_crawl.first_page(video_id, order), perform)
+
+
+async def fetch_reply_threads(tokens, max_replies=100):
+    """Async version of comments.fetch_reply_threads"""
+    return await asyncio.gather(*(fetch_replies(token, max_replies) for token in tokens), return_exceptions=True)
+
+
+async def fetch_replies(continuation_token, max_replies=100):
+    """Async version of comments.fetch_replies"""
+    async with _reply_semaphore():
+        return await _crawl.run_async(_crawl.replies(continuation_token, max_replies), perform)
+
+
+_reply_semaphores = weakref.WeakKeyDictionary()
+
+
+def _reply_semaphore():
+    """Per-loop limit of reply threads fetched at once (REPLY_FANOUT)"""
+    loop = asyncio.get_running_loop()
+    semaphore = _reply_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _reply_semaphores[loop] = asyncio.Semaphore(REPLY_FANOUT)
+    return semaphore
+
+
+async def perform(step):
+    """Do the I/O of one _crawl step on the running loop"""
+    kind, arg = step
+    if kind == _crawl.NEXT:
+        return await fetch_next_page(arg)
+    if kind == _crawl.PROBE:
+        return await fetch_next_page(arg, probe=True)
+    if kind == _crawl.FIRST:
+        return await fetch_first_page(*arg)
+    if kind == _crawl.WATCH:
+        return await fetch_continuation_token(arg)
+    if kind == _crawl.REPLIES:
+        return await fetch_reply_threads(*arg)
+    raise ValueError(f'Unknown crawl step {kind!r}')
+
+
+def iter_comments_from_token(continuation_token, max_results=50, first_page=None, max_replies=0):
+    """Async generator version of comments.iter_comments_from_token"""
+    return _crawl.iterate_async(_crawl.each_comment(continuation_token, max_results, first_page, max_replies),
+                                perform)
+
+
+def iter_comment_pages(continuation_token, max_results=None, first_page=None, max_replies=0):
+    """Async generator version of comments.iter_comment_pages"""
+    return _crawl.iterate_async(_crawl.pages(continuation_token, max_results, first_page, max_replies), perform)
+
+
+async def attach_replies(comments, reply_tokens, max_replies=100):
+    """Async version of comments.attach_replies"""
+    await _crawl.run_async(_crawl.attach_replies(comments, reply_tokens, max_replies), perform)
+
+
+def iter_youtube_comments(video_id, max_results=50, order='top', max_replies=0):
+    """Async generator version of comments.iter_youtube_comments"""
+    return _crawl.iterate_async(_crawl.video_comments(video_id, max_results, order, max_replies), perform)
+
+
+async def fetch_youtube_comments(video_id, max_results=50, order='top', max_replies=0, comment_filter=None):
+    """Async version of comments.fetch_youtube_comments; same result format"""
+    steps = _service.fetch_result(video_id, max_results, order, max_replies, comment_filter)
+    return _service.plain_result(await _crawl.run_async(steps, perform))
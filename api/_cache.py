@@ -0,0 +1,185 @@
+"""
+In-process caches
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Small thread-safe cache with a per-entry TTL and LRU eviction once
+    maxsize entries are stored.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """
+    LRU response cache bounded by entry count and total bytes, with a
+    per-entry TTL and stale-while-revalidate: for stale_ttl seconds after
+    an entry expires it is still served while a background thread reloads
+    it.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=300.0, stale_ttl=3600.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # key -> (value, size, expires_at, stale_until)
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def lookup(self, key):
+        """
+        Return (value, state, refresh) without loading anything. state is
+        'HIT', 'STALE' or None for a miss; refresh is True for the one
+        caller that should reload a stale entry and then call
+        refresh_done().
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, _, expires_at, stale_until = entry
+                if now < expires_at:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value, 'HIT', False
+                if now < stale_until:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    refresh = key not in self._refreshing
+                    if refresh:
+                        self._refreshing.add(key)
+                    return value, 'STALE', refresh
+                self._remove(key)
+            self.misses += 1
+            return None, None, False
+
+    def get_or_load(self, key, loader):
+        """
+        Return (value, state) where state is 'HIT', 'STALE' or 'MISS'.
+
+        loader() must return (value, size); a size of None means the value
+        is not cacheable (e.g. an error result) and is only returned.
+        """
+        value, state, refresh = self.lookup(key)
+        if refresh:
+            threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+        if state is not None:
+            return value, state
+
+        value, size = loader()
+        if size is not None:
+            self.set(key, value, size)
+        return value, 'MISS'
+
+    def set(self, key, value, size, ttl=None):
+        """Store a value, evicting least recently used entries to fit"""
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at, expires_at + self.stale_ttl)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self._refreshing.clear()
+
+    def stats(self):
+        """Return cache counters, entry count and stored bytes"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'entries': len(self._data),
+                'bytes': self._bytes
+            }
+
+    def refresh_done(self, key, ok=True):
+        """Record the end of a background reload started by lookup()"""
+        with self._lock:
+            if ok:
+                self.refreshes += 1
+            else:
+                self.refresh_errors += 1
+            self._refreshing.discard(key)
+
+    def _remove(self, key):
+        _, size, _, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def _refresh(self, key, loader):
+        try:
+            value, size = loader()
+        except Exception:
+            size = None
+        # An uncacheable result (size None, e.g. an error) leaves the stale entry in place
+        if size is not None:
+            self.set(key, value, size)
+        self.refresh_done(key, ok=size is not None)
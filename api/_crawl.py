@@ -0,0 +1,304 @@
+"""
+The comment crawl, written once for both fetch engines.
+
+Nothing here does I/O. The crawl is written as generators of steps: a
+step generator yields a step like (NEXT, token) and is sent the step's
+result, or has the step's exception thrown in. An engine runs it with its
+own I/O primitives (comments.py with the blocking connection pool and
+threads, _aio.py on the event loop) through iterate()/run() or their
+async versions. An (EMIT, value) step hands value to whoever consumes
+the crawl instead, for streamed output.
+
+    (PROBE, token)                  /next page of a token we synthesized
+    (NEXT, token)                   /next page of a token YouTube gave us
+    (WATCH, video_id)               comments token on the watch page, or None
+    (FIRST, (video_id, order))      first_page(), coalesced across requests
+    (REPLIES, (tokens, max_replies))
+                                    replies() of each token, at once; an
+                                    exception in place of a failed thread
+"""
+import json
+import os
+
+from api import _innertube, _metrics, _parse, _singleflight, _tokens
+
+
+PROBE = 'probe'
+NEXT = 'next'
+WATCH = 'watch'
+FIRST = 'first'
+REPLIES = 'replies'
+EMIT = 'emit'
+
+# Reply threads fetched at once across the process
+REPLY_FANOUT = int(os.environ.get('COMMENTS_REPLY_FANOUT', '8'))
+
+# Concurrent requests for the same page share one upstream fetch
+PAGE_FLIGHTS = _singleflight.SingleFlight()
+
+
+class FetchError(Exception):
+    """Raised when an upstream YouTube request fails"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def watch_request(video_id):
+    """(url, headers) of the watch page request"""
+    return _innertube.watch_url(video_id), {
+        'User-Agent': _innertube.USER_AGENT,
+        'Accept-Language': 'en-US,en;q=0.9'
+    }
+
+
+def watch_token(found):
+    """The comments token from a watch page scan; the ytcfg values keep the shared config current"""
+    _innertube.CONFIG.update(found.get('api_key'), found.get('client_version'))
+    return found.get('token')
+
+
+def next_request(continuation_token):
+    """(url, body, headers) of the /next request for a continuation token"""
+    config = _innertube.CONFIG.get()
+    payload = {
+        'context': _innertube.client_context(config),
+        'continuation': continuation_token
+    }
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': _innertube.USER_AGENT
+    }
+    return _innertube.next_url(config), json.dumps(payload).encode('utf-8'), headers
+
+
+def next_error(exc, probe=False):
+    """
+    FetchError for a failed /next request. A rejected probe says nothing
+    about the API key, so only other failures may invalidate the config.
+    """
+    if not probe:
+        _innertube.report_error(exc)
+    return FetchError(f'Failed to fetch comments API: {str(exc)}', status=getattr(exc, 'status', None))
+
+
+def has_continuation_items(api_data):
+    """True if a /next response carries a comments section"""
+    for action in api_data.get('onResponseReceivedEndpoints', []):
+        if 'reloadContinuationItemsCommand' in action or 'appendContinuationItemsAction' in action:
+            return True
+    return False
+
+
+def first_page(video_id, order='top'):
+    """
+    Steps resolving the comments token of a video; returns the first page
+    of comments, or None if the video has no comments section.
+
+    Tokens are tried cheapest first: the token cache, then a token
+    synthesized from the video ID, and only then the one on the watch page.
+    The watch page token is always "top" order, so for other orders it
+    only tells a video without comments from a token we cannot build.
+    """
+    cache_key = (video_id, order)
+    cached = _tokens.TOKEN_CACHE.get(cache_key)
+    if cached == '':
+        return None
+
+    synthesized = _tokens.comments_section_token(video_id, order)
+    for token in dict.fromkeys((cached or synthesized, synthesized)):
+        try:
+            api_data = yield (PROBE, token)
+        except FetchError as e:
+            # Only a rejected token is worth another try; throttling and
+            # network errors would just fail again
+            if e.status not in (400, 404):
+                raise
+            continue
+        if has_continuation_items(api_data):
+            _tokens.TOKEN_CACHE.set(cache_key, token)
+            return api_data
+
+    token = yield (WATCH, video_id)
+    if not token:
+        _tokens.TOKEN_CACHE.set(cache_key, '', ttl=_tokens.NO_COMMENTS_TTL)
+        return None
+    if order != 'top':
+        raise FetchError(f'Could not resolve the comments token for order={order}')
+
+    api_data = yield (NEXT, token)
+    _tokens.TOKEN_CACHE.set(cache_key, token)
+    return api_data
+
+
+class Crawl:
+    """
+    Paging through a thread list (or one reply thread): follow the
+    continuation token of each page until max_results comments (None for
+    all of them) or the end of the list. next_page() is a step generator
+    returning the next page's comments; with max_replies > 0 each comment
+    gets a 'replies' list, fetched for all threads of a page at once.
+    """
+
+    def __init__(self, continuation_token, max_results=None, first_page=None, max_replies=0):
+        self.token = continuation_token
+        self.max_results = max_results
+        self.max_replies = max_replies
+        self.count = 0
+        self._page = first_page
+
+    @property
+    def done(self):
+        if self.max_results is not None and self.count >= self.max_results:
+            return True
+        return self._page is None and not self.token
+
+    def next_page(self):
+        api_data, self._page = self._page, None
+        if api_data is None:
+            api_data = yield (NEXT, self.token)
+        reply_tokens = {} if self.max_replies else None
+        limit = None if self.max_results is None else self.max_results - self.count
+        with _metrics.stage('parse'):
+            comments, self.token = _parse.parse_page(api_data, limit, reply_tokens)
+
+        if self.max_replies:
+            with _metrics.stage('replies'):
+                yield from attach_replies(comments, reply_tokens, self.max_replies)
+
+        self.count += len(comments)
+        return comments
+
+
+def pages(continuation_token, max_results=None, first_page=None, max_replies=0):
+    """Steps emitting (comments, next_token) per page; next_token is where a crawl stopped here would resume"""
+    crawl = Crawl(continuation_token, max_results, first_page, max_replies)
+    while not crawl.done:
+        comments = yield from crawl.next_page()
+        yield (EMIT, (comments, crawl.token))
+
+
+def each_comment(continuation_token, max_results=None, first_page=None, max_replies=0):
+    """Steps emitting the comments of a crawl one at a time"""
+    crawl = Crawl(continuation_token, max_results, first_page, max_replies)
+    while not crawl.done:
+        for comment in (yield from crawl.next_page()):
+            yield (EMIT, comment)
+
+
+def video_comments(video_id, max_results=None, order='top', max_replies=0):
+    """Steps emitting up to max_results comments of a video"""
+    page = yield (FIRST, (video_id, order))
+    if page is not None:
+        yield from each_comment(None, max_results, page, max_replies)
+
+
+def replies(continuation_token, max_replies=100):
+    """Steps returning up to max_replies replies of one thread, following reply pages"""
+    crawl = Crawl(continuation_token, max_replies)
+    thread = []
+    while not crawl.done:
+        thread.extend((yield from crawl.next_page()))
+    return thread
+
+
+def attach_replies(comments, reply_tokens, max_replies=100):
+    """
+    Steps fetching the reply threads of comments and storing them as
+    comment['replies']. A thread whose replies fail to load gets
+    'replies_error' instead of failing the whole crawl.
+    """
+    jobs = []
+    for comment in comments:
+        comment['replies'] = []
+        token = reply_tokens.get(comment['comment_id'])
+        if token:
+            jobs.append((comment, token))
+    if not jobs:
+        return
+
+    results = yield (REPLIES, ([token for _, token in jobs], max_replies))
+    for (comment, _), result in zip(jobs, results):
+        if isinstance(result, FetchError):
+            comment['replies_error'] = str(result)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            comment['replies'] = result
+
+
+def iterate(steps, perform):
+    """
+    Run steps, doing each I/O step with perform(step), a blocking call.
+    A generator: yields what steps emit and returns what steps return.
+    """
+    value = error = None
+    try:
+        while True:
+            try:
+                step = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            value = error = None
+            if step[0] == EMIT:
+                yield step[1]
+                continue
+            try:
+                value = perform(step)
+            except Exception as e:
+                error = e
+    finally:
+        steps.close()
+
+
+def run(steps, perform):
+    """Run steps that emit nothing and return their value"""
+    driver = iterate(steps, perform)
+    try:
+        next(driver)
+    except StopIteration as stop:
+        return stop.value
+    driver.close()
+    raise RuntimeError('Steps emitted a value; use iterate()')
+
+
+async def iterate_async(steps, perform):
+    """iterate() on an event loop: perform(step) is a coroutine function"""
+    value = error = None
+    try:
+        while True:
+            try:
+                step = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration:
+                return
+            value = error = None
+            if step[0] == EMIT:
+                yield step[1]
+                continue
+            try:
+                value = await perform(step)
+            except Exception as e:
+                error = e
+    finally:
+        steps.close()
+
+
+async def run_async(steps, perform):
+    """run() on an event loop"""
+    value = error = None
+    try:
+        while True:
+            try:
+                step = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            if step[0] == EMIT:
+                raise RuntimeError('Steps emitted a value; use iterate_async()')
+            value = error = None
+            try:
+                value = await perform(step)
+            except Exception as e:
+                error = e
+    finally:
+        steps.close()
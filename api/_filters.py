@@ -0,0 +1,175 @@
+"""
+Server-side filtering and top-K selection of crawled comments.
+
+Query parameters:
+    sort=likes|published   order of the returned comments (best/newest first)
+    top=N                  return at most N comments (N >= 1)
+    min_likes=N            drop comments with fewer likes
+    author=NAME            only comments by this author (case-insensitive, '@' optional)
+    q=WORDS                only comments whose text contains WORDS (case-insensitive)
+
+Filters are applied while comments stream out of the fetcher. With sort
+and top, only the best N seen so far are kept, in a bounded heap.
+"""
+import heapq
+import re
+
+from api import _model
+
+
+SORTS = ('likes', 'published')
+PARAMS = ('sort', 'top', 'min_likes', 'author', 'q')
+
+_AGE_RE = re.compile(r'(\d+)\s*(second|minute|hour|day|week|month|year)', re.IGNORECASE)
+_AGE_SECONDS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+    'week': 7 * 86400,
+    'month': 30 * 86400,
+    'year': 365 * 86400
+}
+# Unparseable publish times sort after everything else
+UNKNOWN_AGE = float('inf')
+
+
+def parse_age(published):
+    """Seconds ago from a relative time like '3 days ago (edited)'"""
+    if not published:
+        return UNKNOWN_AGE
+    match = _AGE_RE.search(published)
+    if not match:
+        return UNKNOWN_AGE
+    return int(match.group(1)) * _AGE_SECONDS[match.group(2).lower()]
+
+
+def like_count(comment):
+    count = getattr(comment, 'like_count', None)
+    if count is None:
+        count = _model.parse_likes(comment.get('likes'))
+    return count
+
+
+class CommentFilter:
+    """A set of filters and an optional sort/top-K over comments"""
+
+    def __init__(self, sort=None, top=None, min_likes=None, author=None, q=None):
+        if top is not None and top < 1:
+            raise ValueError('top must be a positive integer')
+        self.sort = sort if sort in SORTS else None
+        self.top = top
+        self.min_likes = min_likes
+        self.author = author.lstrip('@').casefold() if author else None
+        self.q = q.casefold() if q else None
+
+    @property
+    def key(self):
+        """Hashable identity, for cache keys"""
+        return (self.sort, self.top, self.min_likes, self.author, self.q)
+
+    def matches(self, comment):
+        if self.min_likes is not None and like_count(comment) < self.min_likes:
+            return False
+        if self.author is not None and comment.get('author', '').lstrip('@').casefold() != self.author:
+            return False
+        if self.q is not None and self.q not in comment.get('text', '').casefold():
+            return False
+        return True
+
+    def sort_key(self, comment):
+        """Larger is better"""
+        if self.sort == 'likes':
+            return like_count(comment)
+        return -parse_age(comment.get('published'))
+
+    def selection(self, keep=True):
+        return Selection(self, keep)
+
+
+class Selection:
+    """
+    Comments offered one at a time with add(). Unsorted selections pass
+    matches straight through (and keep them if keep is set). Sorted ones
+    hold at most top comments in a min-heap, or every match without top.
+    """
+
+    def __init__(self, comment_filter, keep=True):
+        self.filter = comment_filter
+        self.scanned = 0
+        self.count = 0
+        self._kept = _model.CommentBatch() if keep else None
+        self._heap = [] if comment_filter.sort else None
+
+    @property
+    def sorted(self):
+        return self._heap is not None
+
+    @property
+    def done(self):
+        """True once an unsorted top=N has its N comments; the crawl can stop"""
+        return self._heap is None and self.filter.top is not None and self.count >= self.filter.top
+
+    def add(self, comment):
+        """Offer a crawled comment. Returns it if it should be emitted now."""
+        self.scanned += 1
+        if not self.filter.matches(comment):
+            return None
+        if self._heap is not None:
+            # Ties go to the comment seen first: -scanned is larger for it
+            entry = (self.filter.sort_key(comment), -self.scanned, comment)
+            if self.filter.top is None or len(self._heap) < self.filter.top:
+                heapq.heappush(self._heap, entry)
+            elif entry[:2] > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, entry)
+            return None
+        if self.done:
+            return None
+        self.count += 1
+        if self._kept is not None:
+            self._kept.append(comment)
+        return comment
+
+    def results(self):
+        """The selected comments, best first if sorted"""
+        if self._heap is None:
+            return self._kept if self._kept is not None else _model.CommentBatch()
+        ordered = sorted(self._heap, key=lambda entry: entry[:2], reverse=True)
+        return _model.CommentBatch(entry[2] for entry in ordered)
+
+
+def _int_param(params, name):
+    try:
+        value = int(params.get(name, [None])[0])
+    except (TypeError, ValueError, IndexError):
+        return None
+    return max(0, value)
+
+
+def _top_param(params):
+    top = params.get('top', [''])[0]
+    if not top:
+        return None
+    try:
+        return int(top)
+    except ValueError:
+        raise ValueError('top must be a positive integer') from None
+
+
+def from_params(params):
+    """
+    Build a CommentFilter from query parameters, or None if none were
+    given. Raises ValueError for a top that is not a positive integer.
+    """
+    if not any(params.get(name, [''])[0] for name in PARAMS):
+        return None
+    comment_filter = CommentFilter(
+        sort=params.get('sort', [None])[0],
+        top=_top_param(params),
+        min_likes=_int_param(params, 'min_likes'),
+        author=params.get('author', [None])[0],
+        q=params.get('q', [None])[0]
+    )
+    if comment_filter.key == (None,) * 5:
+        return None
+    return comment_filter
@@ -0,0 +1,217 @@
+"""
+Upstream governor: per-host request rate, adaptive concurrency and backoff.
+
+Every upstream request takes a permit for its host first. Permits come
+from a token bucket and a concurrency limit, both adjusted AIMD-style:
+they grow additively on success and shrink multiplicatively when the
+host throttles us (429: rate and concurrency) or fails (5xx:
+concurrency). A 429 also pauses the host for its Retry-After, or an
+exponential backoff with jitter if there is none.
+
+The state is thread-safe and shared by the sync and async connection
+pools. try_acquire() never blocks: it returns how long to wait, so each
+pool can sleep in its own way.
+"""
+from email.utils import parsedate_to_datetime
+import asyncio
+import os
+import random
+import threading
+import time
+
+
+# Statuses that mean the host is overloaded or throttling us; retried
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Longest wait before re-checking a host whose concurrency limit is full
+_POLL_INTERVAL = 0.05
+
+
+def retry_after_seconds(headers):
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date), or None"""
+    if headers is None:
+        return None
+    # http.client headers are case-insensitive, the async client's are lowercased
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostState:
+    """Bucket, concurrency limit and counters for one upstream host"""
+
+    def __init__(self, rate, burst, max_concurrency):
+        self.rate = float(rate)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.failures = 0
+        self.admitted = 0
+        self.throttled = 0
+        self.errors = 0
+        self.retries = 0
+        self.waited = 0.0
+
+
+class Governor:
+    """
+    Shared per-host limiter. rate and max_concurrency are the ceilings the
+    AIMD limits grow back to (rate in requests per second; 0 disables the
+    bucket). increase is roughly how much each limit grows per second, or
+    per round of requests, without errors.
+    """
+
+    def __init__(self, rate=100.0, burst=50, max_concurrency=32, min_rate=1.0, min_concurrency=1,
+                 increase=1.0, decrease=0.5, backoff_base=0.5, backoff_cap=10.0, max_retries=3):
+        self.rate = rate
+        self.min_rate = min(min_rate, rate) if rate else 0.0
+        self.burst = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.increase = increase
+        self.decrease = decrease
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retries = max_retries
+        self._hosts = {}
+        self._cond = threading.Condition()
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(self.rate, self.burst, self.max_concurrency)
+        return state
+
+    def try_acquire(self, host):
+        """Take a permit and return 0.0, or return the seconds to wait before trying again"""
+        now = time.monotonic()
+        with self._cond:
+            state = self._host(host)
+            if state.paused_until > now:
+                return state.paused_until - now
+            if state.in_flight >= int(state.limit):
+                return _POLL_INTERVAL
+            if self.rate:
+                state.tokens = min(self.burst, state.tokens + (now - state.updated) * state.rate)
+                state.updated = now
+                if state.tokens < 1:
+                    return (1 - state.tokens) / state.rate
+                state.tokens -= 1
+            state.in_flight += 1
+            state.admitted += 1
+            return 0.0
+
+    def acquire(self, host, timeout=None):
+        """Block until a permit for host is available; TimeoutError after timeout seconds"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                wait = self.try_acquire(host)
+                if not wait:
+                    self._host(host).waited += time.monotonic() - started
+                    return
+                if deadline is not None:
+                    if time.monotonic() + wait > deadline:
+                        raise TimeoutError(f'Timed out waiting for an upstream permit for {host}')
+                # Woken early when a permit is released
+                self._cond.wait(wait)
+
+    async def acquire_async(self, host, timeout=None):
+        """acquire() for event loops; polls instead of holding the lock"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        started = time.monotonic()
+        while True:
+            wait = self.try_acquire(host)
+            if not wait:
+                with self._cond:
+                    self._host(host).waited += time.monotonic() - started
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise TimeoutError(f'Timed out waiting for an upstream permit for {host}')
+            await asyncio.sleep(wait)
+
+    def release(self, host, status=None, retry_after=None):
+        """
+        Return a permit. status is the upstream status, or None if the
+        request failed without a response (timeout, reset).
+        """
+        now = time.monotonic()
+        with self._cond:
+            state = self._host(host)
+            state.in_flight = max(0, state.in_flight - 1)
+            if status is not None and status not in RETRY_STATUSES:
+                state.failures = 0
+                # +increase per limit's worth of successes: per round trip for
+                # concurrency, per second for the rate
+                state.limit = min(self.max_concurrency, state.limit + self.increase / state.limit)
+                if self.rate:
+                    state.rate = min(self.rate, state.rate + self.increase / state.rate)
+            else:
+                state.failures += 1
+                if status == 429:
+                    state.throttled += 1
+                    pause = retry_after if retry_after is not None else self._backoff(state.failures)
+                    state.paused_until = max(state.paused_until, now + min(pause, self.backoff_cap))
+                else:
+                    state.errors += 1
+                # Decrease at most once per backoff_base so a burst of failures from
+                # requests sent at the same limit counts as one congestion signal
+                if now - state.last_decrease >= self.backoff_base:
+                    state.limit = max(self.min_concurrency, state.limit * self.decrease)
+                    if status == 429 and self.rate:
+                        state.rate = max(self.min_rate, state.rate * self.decrease)
+                    state.last_decrease = now
+            self._cond.notify_all()
+
+    def retry_delay(self, host, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (from 1); Retry-After wins when given"""
+        with self._cond:
+            self._host(host).retries += 1
+        if retry_after is not None:
+            # A little jitter so clients told the same Retry-After don't return in lockstep
+            return min(self.backoff_cap, retry_after) + random.uniform(0, self.backoff_base)
+        return self._backoff(attempt)
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def stats(self):
+        """Per-host limit, in-flight and throttling counters"""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                host: {
+                    'rate': round(state.rate, 2),
+                    'limit': round(state.limit, 2),
+                    'in_flight': state.in_flight,
+                    'paused_for': round(max(0.0, state.paused_until - now), 2),
+                    'admitted': state.admitted,
+                    'throttled': state.throttled,
+                    'errors': state.errors,
+                    'retries': state.retries,
+                    'waited': round(state.waited, 3)
+                }
+                for host, state in self._hosts.items()
+            }
+
+
+GOVERNOR = Governor(
+    rate=float(os.environ.get('UPSTREAM_RATE', '100')),
+    burst=int(os.environ.get('UPSTREAM_BURST', '50')),
+    max_concurrency=int(os.environ.get('UPSTREAM_MAX_CONCURRENCY', '32')),
+    backoff_cap=float(os.environ.get('UPSTREAM_BACKOFF_CAP', '10')),
+    max_retries=int(os.environ.get('UPSTREAM_MAX_RETRIES', '3'))
+)
@@ -0,0 +1,177 @@
+"""
+Incremental, event-based JSON scanner for innertube /next responses.
+
+Instead of json.loads on the whole body, the response is fed in chunks and
+only the subtrees under a few known keys are decoded. Everything else is
+skipped by a regex search and never turned into Python objects. Only the
+tail of the input that may still hold an unfinished match or subtree is
+kept in memory.
+
+The scanner costs more per byte than json.loads, and wins only on big
+bodies, where skipping the UI tree saves more than the scan costs and the
+memory peak stays flat: on synthetic pages the two break even around
+40 KB, and at 500 KB the scanner is twice as fast with a tenth of the
+peak. PageDecoder therefore buffers bodies up to SCAN_MIN_SIZE and
+json.loads them, and only switches to the scanner for larger ones.
+
+A match is '"key":' with no backslash before the opening quote. Inside
+JSON strings quotes are escaped, and a string value is never followed by
+':', so only real object keys match.
+"""
+import codecs
+import json
+import re
+
+from api import _scan
+
+
+# /next bodies smaller than this are parsed with json.loads
+SCAN_MIN_SIZE = 64 * 1024
+
+# Subtrees decoded for a comments page
+PAGE_CAPTURE = (
+    'commentThreadRenderer',
+    'commentViewModel',
+    'commentRenderer',
+    'continuationItemRenderer',
+    'commentEntityPayload',
+)
+
+# Keys only reported as present; their values are not decoded
+PAGE_MARKERS = (
+    'reloadContinuationItemsCommand',
+    'appendContinuationItemsAction',
+)
+
+
+class JSONScanner:
+    """
+    Feed bytes, get (key, value) events in document order. value is the
+    decoded subtree for capture keys and None for marker keys. Subtrees
+    nested inside a captured one are not reported separately.
+    """
+
+    def __init__(self, capture, markers=()):
+        self.capture = frozenset(capture)
+        self.markers = frozenset(markers)
+        names = '|'.join(re.escape(name) for name in sorted(self.capture | self.markers, key=len, reverse=True))
+        self._key_re = re.compile(r'"(' + names + r')"\s*:\s*')
+        self._overlap = max(len(name) for name in self.capture | self.markers) + 16
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self.bytes_in = 0
+
+    def feed(self, data, final=False):
+        """Scan the next chunk of input; returns the events it completed"""
+        self.bytes_in += len(data)
+        buf = self._buffer + self._text.decode(data, final)
+        events = []
+        pos = 0
+        while True:
+            match = self._key_re.search(buf, pos)
+            if match is None:
+                # Keep enough of the tail for a key cut off by the chunk end
+                pos = max(pos, len(buf) - self._overlap)
+                break
+            if match.start() and buf[match.start() - 1] == '\\':
+                pos = match.end()
+                continue
+            key = match.group(1)
+            if key in self.markers:
+                events.append((key, None))
+                pos = match.end()
+                continue
+            try:
+                value, end = self._json.raw_decode(buf, match.end())
+            except ValueError:
+                if final:
+                    raise
+                # The subtree isn't complete yet; resume from its key
+                pos = match.start()
+                break
+            events.append((key, value))
+            pos = end
+
+        self._buffer = buf[pos:] if not final else ''
+        return events
+
+    def close(self):
+        """Signal end of input; returns any remaining events"""
+        return self.feed(b'', final=True)
+
+
+def page_scanner():
+    return JSONScanner(PAGE_CAPTURE, PAGE_MARKERS)
+
+
+class PageDecoder:
+    """
+    Feed a /next body in chunks, then close() returns the page: the
+    json.loads result for bodies under min_scan_size, otherwise the
+    reduced page rebuilt from scanner events. Both have the shape
+    _parse.parse_page expects.
+    """
+
+    def __init__(self, min_scan_size=SCAN_MIN_SIZE):
+        self.min_scan_size = min_scan_size
+        self._parts = []
+        self._size = 0
+        self._scanner = None
+        self._events = []
+
+    def feed(self, data):
+        if self._scanner is None:
+            self._parts.append(data)
+            self._size += len(data)
+            if self._size < self.min_scan_size:
+                return
+            # Big enough to be worth scanning; start with what was buffered
+            self._scanner = page_scanner()
+            data = b''.join(self._parts)
+            self._parts = None
+        self._events.extend(self._scanner.feed(data))
+
+    def close(self):
+        if self._scanner is None:
+            return json.loads(b''.join(self._parts))
+        self._events.extend(self._scanner.close())
+        return page_from_events(self._events)
+
+
+def scan_page(response, chunk_size=_scan.CHUNK_SIZE, min_scan_size=SCAN_MIN_SIZE):
+    """Read a /next response in chunks and return its page (see PageDecoder)"""
+    decoder = PageDecoder(min_scan_size)
+    while True:
+        data = response.read(chunk_size)
+        if not data:
+            break
+        decoder.feed(data)
+    return decoder.close()
+
+
+def page_from_events(events):
+    """
+    Rebuild a minimal /next response from scanner events, in the shape
+    _parse.parse_page and the first page checks expect: one continuation
+    items action and the comment entity mutations.
+    """
+    action = None
+    items = []
+    mutations = []
+    for key, value in events:
+        if value is None:
+            # A page has one items action; keep reload if it says so
+            if action is None or key == 'reloadContinuationItemsCommand':
+                action = key
+        elif key == 'commentEntityPayload':
+            mutations.append({'payload': {key: value}})
+        else:
+            items.append({key: value})
+
+    page = {}
+    if action is not None:
+        page['onResponseReceivedEndpoints'] = [{action: {'continuationItems': items}}]
+    if mutations:
+        page['frameworkUpdates'] = {'entityBatchUpdate': {'mutations': mutations}}
+    return page
@@ -0,0 +1,237 @@
+"""
+In-process metrics: per-stage timings, counters and histograms.
+
+Hot paths wrap their stages in `with stage(name):`. Every stage is
+observed in a process-wide histogram and, while a request is being timed
+(see start_request), also added to that request's Timings, which become
+its Server-Timing header. render() formats everything, plus the stats
+of registered collectors, in the Prometheus text format.
+
+Recording is two perf_counter() calls and a short lock, so it stays on.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+
+PREFIX = 'youtube_comments_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, help, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.label_names = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((label_values, list(counts), total)
+                            for label_values, (counts, total) in self._series.items())
+        for label_values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, label_values)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, label_values)} {cumulative}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('stage_seconds', 'Time spent per request stage', ('stage',))
+REQUEST_SECONDS = Histogram('request_seconds', 'Handler time per request', ('endpoint',))
+REQUESTS = Counter('requests_total', 'Requests served', ('endpoint', 'cache'))
+ERRORS = Counter('errors_total', 'Failed fetches by error type and upstream status', ('type', 'status'))
+UPSTREAM_RESPONSES = Counter('upstream_responses_total', 'Upstream responses by status', ('status',))
+UPSTREAM_BYTES = Counter('upstream_bytes_total', 'Upstream response body bytes read')
+UPSTREAM_RESPONSE_BYTES = Histogram('upstream_response_bytes', 'Upstream response body bytes read',
+                                    buckets=BYTES_BUCKETS)
+
+
+class Timings:
+    """Stage durations of one request, for its Server-Timing header"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.notes = []
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            total, count = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + seconds, count + 1)
+
+    def note(self, name, description):
+        """A Server-Timing entry without a duration, e.g. cache;desc=HIT"""
+        self.notes.append((name, description))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        """Server-Timing header value; repeated stages are summed"""
+        with self._lock:
+            stages = list(self.stages.items())
+        parts = [f'{name};desc="{_escape(description)}"' for name, description in self.notes]
+        for name, (total, count) in stages:
+            part = f'{name};dur={total * 1000:.1f}'
+            if count > 1:
+                part += f';desc="{count}x"'
+            parts.append(part)
+        parts.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(parts)
+
+
+_current = contextvars.ContextVar('timings', default=None)
+
+
+def start_request():
+    """Start timing a request in the current context and return its Timings"""
+    timings = Timings()
+    _current.set(timings)
+    return timings
+
+
+def current():
+    """Timings of the request in the current context, or None"""
+    return _current.get()
+
+
+def record(name, seconds):
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+class stage:
+    """Context manager timing one stage: with stage('parse'): ..."""
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.started)
+
+
+def finish_request(endpoint, timings, cache=''):
+    """Count a finished request and observe its total time"""
+    REQUESTS.inc(endpoint, cache)
+    REQUEST_SECONDS.observe(timings.elapsed(), endpoint)
+
+
+def count_error(exc):
+    """Count a failed fetch by exception type and upstream status"""
+    status = getattr(exc, 'status', None)
+    ERRORS.inc(type(exc).__name__, '' if status is None else str(status))
+
+
+def count_response(status, bytes_read=None):
+    """Count an upstream response and, once its body was read, its size"""
+    UPSTREAM_RESPONSES.inc(str(status))
+    if bytes_read is not None:
+        UPSTREAM_BYTES.inc(amount=bytes_read)
+        UPSTREAM_RESPONSE_BYTES.observe(bytes_read)
+
+
+def register_collector(name, collect, label=None):
+    """
+    Render the stats dict returned by collect() as gauges named
+    <name>_<key> on every scrape; nested dicts extend the name. With
+    label, the top-level keys are values of that label (e.g. per host).
+    """
+    _collectors.append((name, collect, label))
+
+
+def _flatten(name, value, labels, series):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f'{name}_{key}', item, labels, series)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        series.setdefault(name, []).append((labels, value))
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    series = {}
+    for name, collect, label in _collectors:
+        stats = collect()
+        if label is None:
+            _flatten(PREFIX + name, stats, '', series)
+        else:
+            for label_value, item in stats.items():
+                _flatten(PREFIX + name, item, _labels((label,), (label_value,)), series)
+    for name, samples in series.items():
+        lines.append(f'# TYPE {name} gauge')
+        lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,261 @@
+"""
+Compact in-memory comment records for large crawls.
+
+Comment is a __slots__ record for one comment. CommentBatch holds many
+comments column by column: parallel lists with interned author, likes and
+publish time strings, and like counts as integers in an array. Both
+serialize straight to JSON without building a dict per comment, and
+dumps() writes results that contain batches.
+"""
+from array import array
+from json.encoder import encode_basestring_ascii
+import json
+import re
+import sys
+
+
+FIELDS = ('comment_id', 'author', 'text', 'likes', 'published')
+
+_LIKES_RE = re.compile(r'([\d.,]+)\s*([KMB]?)', re.IGNORECASE)
+_MULTIPLIERS = {'': 1, 'K': 1000, 'M': 1000000, 'B': 1000000000}
+
+# Placeholder for a batch while the rest of a result goes through json.dumps
+_SLOT = '\x00CommentBatch:%d\x00'
+_SLOT_RE = re.compile(r'"\\u0000CommentBatch:(\d+)\\u0000"')
+
+
+def parse_likes(text):
+    """Like count from YouTube's display string: '1.2K' -> 1200, '1,234' -> 1234"""
+    if not text:
+        return 0
+    match = _LIKES_RE.search(text)
+    if not match:
+        return 0
+    number, suffix = match.groups()
+    suffix = suffix.upper()
+    if suffix:
+        # '1,2K' in locales that use a decimal comma
+        number = number.replace(',', '.')
+    else:
+        number = number.replace(',', '').replace('.', '')
+    try:
+        return int(float(number) * _MULTIPLIERS[suffix])
+    except ValueError:
+        return 0
+
+
+class Comment:
+    """
+    One comment. Supports comment['text'] and comment.get() so it can
+    stand in where the crawler used to pass dicts.
+    """
+    __slots__ = FIELDS + ('like_count', 'extra')
+
+    def __init__(self, comment_id, author, text, likes, published, like_count=None, extra=None):
+        self.comment_id = comment_id
+        self.author = author
+        self.text = text
+        self.likes = likes
+        self.published = published
+        self.like_count = parse_likes(likes) if like_count is None else like_count
+        # Keys beyond the base fields, like 'replies', in insertion order
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, comment):
+        extra = {key: value for key, value in comment.items() if key not in FIELDS} or None
+        return cls(comment.get('comment_id'), comment.get('author', 'Unknown'), comment.get('text', ''),
+                   comment.get('likes', '0'), comment.get('published', ''), extra=extra)
+
+    def to_dict(self):
+        comment = {field: getattr(self, field) for field in FIELDS}
+        if self.extra:
+            comment.update(self.extra)
+        return comment
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if isinstance(other, Comment):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f'Comment({self.comment_id!r}, {self.author!r}, likes={self.like_count})'
+
+    def to_json(self, indent=None, separators=None, level=0):
+        return _encode_row(self.comment_id, self.author, self.text, self.likes, self.published,
+                           self.extra, indent, separators, level)
+
+
+class CommentBatch:
+    """
+    Column store for the comments of a crawl, in crawl order. Indexing and
+    iteration give Comment objects built on the fly.
+    """
+
+    def __init__(self, comments=()):
+        self.comment_ids = []
+        self.authors = []
+        self.texts = []
+        self.likes = []
+        self.like_counts = array('q')
+        self.published = []
+        # Sparse {row: extra keys}, only rows that have replies and such
+        self.extras = {}
+        self.extend(comments)
+
+    def append(self, comment):
+        """Add a comment dict or Comment"""
+        if isinstance(comment, Comment):
+            comment_id, author, text = comment.comment_id, comment.author, comment.text
+            likes, published, like_count, extra = comment.likes, comment.published, comment.like_count, comment.extra
+        else:
+            comment_id = comment.get('comment_id')
+            author = comment.get('author', 'Unknown')
+            text = comment.get('text', '')
+            likes = comment.get('likes', '0')
+            published = comment.get('published', '')
+            like_count = None
+            extra = {key: value for key, value in comment.items() if key not in FIELDS} or None
+
+        if extra:
+            self.extras[len(self.comment_ids)] = extra
+        self.comment_ids.append(comment_id)
+        # Authors, like strings and relative times repeat a lot across a crawl
+        self.authors.append(sys.intern(author) if type(author) is str else author)
+        self.texts.append(text)
+        self.likes.append(sys.intern(likes) if type(likes) is str else likes)
+        self.like_counts.append(parse_likes(likes) if like_count is None else like_count)
+        self.published.append(sys.intern(published) if type(published) is str else published)
+
+    def extend(self, comments):
+        for comment in comments:
+            self.append(comment)
+
+    def __len__(self):
+        return len(self.comment_ids)
+
+    def __bool__(self):
+        return bool(self.comment_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CommentBatch(self[i] for i in range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('comment index out of range')
+        return Comment(self.comment_ids[index], self.authors[index], self.texts[index], self.likes[index],
+                       self.published[index], self.like_counts[index], self.extras.get(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def to_dicts(self):
+        return [comment.to_dict() for comment in self]
+
+    def iter_json(self, indent=None, separators=None, level=0):
+        """Yield the batch as a JSON array in pieces, formatted like json.dumps"""
+        if not self.comment_ids:
+            yield '[]'
+            return
+        item_separator = _separators(indent, separators)[0]
+        if indent is None:
+            yield '['
+            first, join = '', item_separator
+        else:
+            newline = '\n' + ' ' * (indent * (level + 1))
+            yield '['
+            first, join = newline, item_separator + newline
+        for index in range(len(self.comment_ids)):
+            yield (join if index else first) + _encode_row(
+                self.comment_ids[index], self.authors[index], self.texts[index], self.likes[index],
+                self.published[index], self.extras.get(index), indent, separators, level + 1)
+        yield ']' if indent is None else '\n' + ' ' * (indent * level) + ']'
+
+    def iter_ndjson(self):
+        """Yield one compact JSON line (bytes) per comment"""
+        for index in range(len(self.comment_ids)):
+            yield _encode_row(self.comment_ids[index], self.authors[index], self.texts[index], self.likes[index],
+                              self.published[index], self.extras.get(index), None, (',', ':'), 0).encode() + b'\n'
+
+
+def _separators(indent, separators):
+    if separators is not None:
+        return separators
+    return (', ', ': ') if indent is None else (',', ': ')
+
+
+def _encode_value(value):
+    if type(value) is str:
+        return encode_basestring_ascii(value)
+    return json.dumps(value)
+
+
+def _encode_row(comment_id, author, text, likes, published, extra, indent, separators, level):
+    item_separator, key_separator = _separators(indent, separators)
+    values = [comment_id, author, text, likes, published]
+    parts = [encode_basestring_ascii(field) + key_separator + _encode_value(value)
+             for field, value in zip(FIELDS, values)]
+    if extra:
+        for key, value in extra.items():
+            encoded = json.dumps(value, indent=indent, separators=separators)
+            if indent is not None:
+                encoded = encoded.replace('\n', '\n' + ' ' * (indent * (level + 1)))
+            parts.append(encode_basestring_ascii(key) + key_separator + encoded)
+    if indent is None:
+        return '{' + item_separator.join(parts) + '}'
+    newline = '\n' + ' ' * (indent * (level + 1))
+    return '{' + newline + (item_separator + newline).join(parts) + '\n' + ' ' * (indent * level) + '}'
+
+
+def dumps(obj, indent=None, separators=None):
+    """
+    json.dumps that also accepts CommentBatch values inside obj (at any
+    depth of dicts and lists) and produces the same text as if they were
+    lists of dicts.
+    """
+    batches = []
+
+    def swap(value):
+        if isinstance(value, CommentBatch):
+            batches.append(value)
+            return _SLOT % (len(batches) - 1)
+        if isinstance(value, Comment):
+            return value.to_dict()
+        if isinstance(value, dict):
+            return {key: swap(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [swap(item) for item in value]
+        return value
+
+    text = json.dumps(swap(obj), indent=indent, separators=separators)
+    if not batches:
+        return text
+
+    def expand(match):
+        batch = batches[int(match.group(1))]
+        level = 0
+        if indent:
+            # Nesting depth from the indentation of the line holding the slot
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            level = (len(text[line_start:match.start()]) - len(text[line_start:match.start()].lstrip(' '))) // indent
+        return ''.join(batch.iter_json(indent, separators, level))
+
+    return _SLOT_RE.sub(expand, text)
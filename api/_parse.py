@@ -0,0 +1,213 @@
+"""
+Unified comment parser for innertube /next responses.
+
+Handles both layouts YouTube has served:
+  - renderer: comment data inline in commentThreadRenderer.comment.commentRenderer
+  - entity:   commentThreadRenderer.commentViewModel holds only the commentId;
+              the data is in frameworkUpdates.entityBatchUpdate.mutations
+              as commentEntityPayload entries
+
+Both produce the same normalized record:
+    {'comment_id', 'author', 'text', 'likes', 'published'}
+plus 'author_thumbnail' when thumbnails=True.
+"""
+import re
+
+
+SCHEMA_ENTITY = 'entity'
+SCHEMA_RENDERER = 'renderer'
+
+_DIGITS_RE = re.compile(r'\d+')
+
+
+def continuation_items(api_data):
+    """Yield the continuationItems lists of a /next response"""
+    for action in api_data.get('onResponseReceivedEndpoints', []):
+        if 'reloadContinuationItemsCommand' in action:
+            yield action['reloadContinuationItemsCommand'].get('continuationItems', [])
+        elif 'appendContinuationItemsAction' in action:
+            yield action['appendContinuationItemsAction'].get('continuationItems', [])
+
+
+def mutations(api_data):
+    """The entityBatchUpdate mutations of a /next response"""
+    return api_data.get('frameworkUpdates', {}).get('entityBatchUpdate', {}).get('mutations', [])
+
+
+def detect_schema(api_data):
+    """Return SCHEMA_ENTITY, SCHEMA_RENDERER or None if there are no comments"""
+    for items in continuation_items(api_data):
+        for item in items:
+            thread = item.get('commentThreadRenderer')
+            if thread is not None:
+                return SCHEMA_RENDERER if 'comment' in thread else SCHEMA_ENTITY
+            if 'commentRenderer' in item:
+                return SCHEMA_RENDERER
+            if 'commentViewModel' in item:
+                return SCHEMA_ENTITY
+    return None
+
+
+def parse_page(api_data, max_results=None, reply_tokens=None, thumbnails=False):
+    """
+    Parse one /next response (a page of threads or of replies).
+    Returns (comments, next_continuation_token); the token is None on the
+    last page. At most max_results comments are resolved. If reply_tokens
+    is a dict, it is filled with {comment_id: first reply page token}.
+    """
+    return parse_items(continuation_items(api_data), mutations(api_data),
+                       max_results, reply_tokens, thumbnails)
+
+
+def parse_items(item_lists, entity_mutations=(), max_results=None, reply_tokens=None, thumbnails=False):
+    """
+    Parse lists of continuation items in order, resolving entity-layout
+    comments against entity_mutations.
+
+    The items are walked once to get the ordered comment IDs (renderer
+    comments are built on the spot). The mutations are then walked once,
+    building records only for the IDs we want and stopping as soon as all
+    of them are resolved.
+    """
+    # Ordered slots: a record for renderer comments, an ID for entity ones
+    slots = []
+    wanted = {}
+    next_token = None
+
+    for items in item_lists:
+        for item in items:
+            if max_results is not None and len(slots) >= max_results:
+                # Keep looking only for the continuation, always last
+                if 'continuationItemRenderer' in item:
+                    next_token = continuation_token(item['continuationItemRenderer']) or next_token
+                continue
+
+            if 'commentThreadRenderer' in item:
+                thread = item['commentThreadRenderer']
+                renderer = thread.get('comment', {}).get('commentRenderer')
+                if renderer is not None:
+                    record = _renderer_record(renderer, thumbnails)
+                    comment_id = record['comment_id']
+                    slots.append(record)
+                else:
+                    comment_id = thread.get('commentViewModel', {}).get('commentViewModel', {}).get('commentId')
+                    if not comment_id:
+                        continue
+                    slots.append(comment_id)
+                    wanted[comment_id] = None
+                if reply_tokens is not None and 'replies' in thread:
+                    token = replies_token(thread['replies'])
+                    if token:
+                        reply_tokens[comment_id] = token
+            elif 'commentViewModel' in item:
+                # Reply pages list the comments without a thread wrapper
+                comment_id = item['commentViewModel'].get('commentViewModel', {}).get('commentId')
+                if comment_id:
+                    slots.append(comment_id)
+                    wanted[comment_id] = None
+            elif 'commentRenderer' in item:
+                slots.append(_renderer_record(item['commentRenderer'], thumbnails))
+            elif 'continuationItemRenderer' in item:
+                next_token = continuation_token(item['continuationItemRenderer']) or next_token
+
+    if wanted:
+        pending = len(wanted)
+        for mutation in entity_mutations:
+            payload = mutation.get('payload')
+            if not payload or 'commentEntityPayload' not in payload:
+                continue
+            entity = payload['commentEntityPayload']
+            comment_id = entity.get('properties', {}).get('commentId')
+            if comment_id in wanted and wanted[comment_id] is None:
+                wanted[comment_id] = _entity_record(entity, thumbnails)
+                pending -= 1
+                if not pending:
+                    break
+
+    comments = []
+    for slot in slots:
+        if isinstance(slot, str):
+            slot = wanted[slot]
+            if slot is None:
+                continue
+        comments.append(slot)
+    return comments, next_token
+
+
+def legacy_record(record):
+    """
+    A record as the api/youtube.py and api/index.py routes have always
+    returned it: no comment_id, and 'Unknown' for a missing publish time.
+    """
+    legacy = {key: value for key, value in record.items() if key != 'comment_id'}
+    legacy['published'] = legacy['published'] or 'Unknown'
+    return legacy
+
+
+def _entity_record(entity, thumbnails):
+    properties = entity.get('properties', {})
+    toolbar = entity.get('toolbar', {}) or properties.get('toolbar', {})
+    record = {
+        'comment_id': properties.get('commentId'),
+        'author': properties.get('authorButtonA11y', 'Unknown'),
+        'text': properties.get('content', {}).get('content', ''),
+        # likeCountLiked is the count as it would read after the viewer liked the comment
+        'likes': toolbar.get('likeCountNotliked', toolbar.get('likeCountLiked', '0')),
+        'published': properties.get('publishedTime', '')
+    }
+    if thumbnails:
+        record['author_thumbnail'] = entity.get('author', {}).get('avatarThumbnailUrl', '')
+    return record
+
+
+def _renderer_record(renderer, thumbnails):
+    content_text = renderer.get('contentText', {})
+    if 'runs' in content_text:
+        text = ''.join([run.get('text', '') for run in content_text['runs']])
+    else:
+        text = content_text.get('simpleText', '')
+
+    likes = '0'
+    vote_count = renderer.get('voteCount', {})
+    if 'simpleText' in vote_count:
+        likes = vote_count['simpleText']
+    elif 'accessibility' in vote_count:
+        label = vote_count['accessibility'].get('accessibilityData', {}).get('label', '0')
+        match = _DIGITS_RE.search(label)
+        likes = match.group(0) if match else '0'
+
+    published_time = renderer.get('publishedTimeText', {})
+    if 'runs' in published_time:
+        published = published_time['runs'][0].get('text', '')
+    else:
+        published = published_time.get('simpleText', '')
+
+    record = {
+        'comment_id': renderer.get('commentId'),
+        'author': renderer.get('authorText', {}).get('simpleText', 'Unknown'),
+        'text': text,
+        'likes': likes,
+        'published': published
+    }
+    if thumbnails:
+        thumbnail_list = renderer.get('authorThumbnail', {}).get('thumbnails', [])
+        record['author_thumbnail'] = thumbnail_list[0].get('url', '') if thumbnail_list else ''
+    return record
+
+
+def continuation_token(renderer):
+    """Extract the token from a continuationItemRenderer"""
+    endpoint = renderer.get('continuationEndpoint')
+    if endpoint is None:
+        # "Show more" style continuations wrap the endpoint in a button
+        endpoint = renderer.get('button', {}).get('buttonRenderer', {}).get('command', {})
+    return endpoint.get('continuationCommand', {}).get('token')
+
+
+def replies_token(replies):
+    """Extract the first reply page token from a thread's replies section"""
+    contents = replies.get('commentRepliesRenderer', {}).get('contents', [])
+    for content in contents:
+        if 'continuationItemRenderer' in content:
+            return continuation_token(content['continuationItemRenderer'])
+    return None
@@ -0,0 +1,142 @@
+"""
+On-demand profiling of single requests.
+
+A request with profile=1 runs under cProfile and tracemalloc if it also
+carries the admin token (X-Profile-Token header or profile_token
+parameter) matching COMMENTS_PROFILE_TOKEN. Without that variable
+profiling is off and the flag is ignored. The report lists the top
+functions by cumulative time and the top allocation sites. With
+COMMENTS_PROFILE_DIR set, the raw stats are also saved as a .prof file
+for snakeviz / pstats.
+
+cProfile only sees the request's own thread, so work in the reply
+fetcher threads shows up as waiting in attach_replies.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+
+
+PROFILE_TOKEN = os.environ.get('COMMENTS_PROFILE_TOKEN') or None
+PROFILE_DIR = os.environ.get('COMMENTS_PROFILE_DIR') or None
+
+# Frames kept per allocation traceback, and rows per report table
+TRACE_FRAMES = 8
+TOP = 25
+
+_LIBRARY_PATH_RE = re.compile(r'.*[/\\](?:site-packages|lib[/\\]python\d+\.\d+)[/\\]')
+
+# tracemalloc is process-wide, so one profiled request at a time
+_lock = threading.Lock()
+
+
+class ProfileBusy(Exception):
+    """Raised when another request is already being profiled"""
+
+
+def requested(params, headers):
+    """True if the request asks for profiling and carries the admin token"""
+    if PROFILE_TOKEN is None or params.get('profile', ['0'])[0] not in ('1', 'true'):
+        return False
+    token = headers.get('X-Profile-Token') or params.get('profile_token', [''])[0]
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def run(label, fn, *args, top=TOP):
+    """
+    Call fn(*args) under cProfile and tracemalloc. Returns (result,
+    report). Raises ProfileBusy if another profile is running.
+    """
+    if not _lock.acquire(blocking=False):
+        raise ProfileBusy('Another request is being profiled')
+    try:
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start(TRACE_FRAMES)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            result = fn(*args)
+        finally:
+            profiler.disable()
+            wall = time.perf_counter() - started
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if not tracing:
+                tracemalloc.stop()
+    finally:
+        _lock.release()
+
+    report = {
+        'wall': round(wall, 4),
+        'peak_memory': peak,
+        'functions': top_functions(profiler, top),
+        'allocations': top_allocations(before, after, top)
+    }
+    if PROFILE_DIR:
+        report['saved'] = save(profiler, label)
+    return result, report
+
+
+def top_functions(profiler, top=TOP):
+    """Rows of the pstats table sorted by cumulative time"""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    rows = []
+    for func in stats.fcn_list[:top]:
+        _, calls, total, cumulative, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append({
+            'function': name,
+            'file': _short_path(filename),
+            'line': line,
+            'calls': calls,
+            'total': round(total, 6),
+            'cumulative': round(cumulative, 6)
+        })
+    return rows
+
+
+def top_allocations(before, after, top=TOP):
+    """Allocation sites that grew the most between two snapshots"""
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+    rows = []
+    for stat in diff[:top]:
+        frame = stat.traceback[0]
+        rows.append({
+            'site': f'{_short_path(frame.filename)}:{frame.lineno}',
+            'size': stat.size_diff,
+            'count': stat.count_diff
+        })
+    return rows
+
+
+def save(profiler, label):
+    """Write the raw stats to PROFILE_DIR/<label>-<time>.prof; returns the path"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = re.sub(r'[^A-Za-z0-9_-]', '_', label) + time.strftime('-%Y%m%d-%H%M%S') + '.prof'
+    path = os.path.join(PROFILE_DIR, name)
+    profiler.dump_stats(path)
+    return path
+
+
+def _short_path(filename):
+    """Path relative to the project or site-packages, for readable reports"""
+    match = _LIBRARY_PATH_RE.match(filename)
+    if match:
+        return filename[match.end():]
+    try:
+        return os.path.relpath(filename)
+    except ValueError:
+        return filename
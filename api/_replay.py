@@ -0,0 +1,176 @@
+"""
+Record and replay upstream HTTP exchanges as fixture files.
+
+A Recorder wraps the real transport and saves every exchange into a
+fixtures directory; a ReplayTransport serves them back. Install either
+with _upstream.install() and the sync fetch code runs unchanged, fully
+offline when replaying.
+
+Each exchange is <key>.json (method, url, status, headers) plus
+<key>.body. The key ignores the host, the API key query parameter and
+the innertube client context, so fixtures survive config refreshes.
+"""
+from urllib.parse import urlsplit, parse_qsl
+import hashlib
+import http.client
+import io
+import json
+import os
+import threading
+
+from api import _upstream
+
+
+def exchange_key(method, url, body=None):
+    """Stable fixture key for a request"""
+    parts = urlsplit(url)
+    material = {
+        'method': method,
+        'path': parts.path,
+        'query': sorted((name, value) for name, value in parse_qsl(parts.query) if name != 'key')
+    }
+    if body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            material['body'] = hashlib.sha1(body).hexdigest()
+        else:
+            if isinstance(payload, dict):
+                payload.pop('context', None)
+            material['body'] = payload
+    return hashlib.sha1(json.dumps(material, sort_keys=True).encode()).hexdigest()[:20]
+
+
+class ReplayResponse:
+    """In-memory response with the PooledResponse interface"""
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._body = io.BytesIO(body)
+
+    def read(self, amt=None):
+        return self._body.read(amt)
+
+    def readinto(self, buffer):
+        return self._body.readinto(buffer)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _message(header_items):
+    headers = http.client.HTTPMessage()
+    for name, value in header_items:
+        headers[name] = value
+    return headers
+
+
+class ReplayTransport:
+    """
+    Serves recorded exchanges. Unknown requests raise LookupError, or
+    are passed to fallback if one is given.
+    """
+
+    def __init__(self, directory=None, fallback=None):
+        self.fallback = fallback
+        self._exchanges = {}
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.missing = 0
+        if directory:
+            self.load(directory)
+
+    def load(self, directory):
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json') or name == 'manifest.json':
+                continue
+            with open(os.path.join(directory, name), 'r') as f:
+                meta = json.load(f)
+            with open(os.path.join(directory, meta['body']), 'rb') as f:
+                body = f.read()
+            self._exchanges[name[:-len('.json')]] = (meta['status'], meta['reason'], meta['headers'], body)
+
+    def add(self, method, url, request_body, response_body, status=200, reason='OK', headers=()):
+        """Register an exchange directly, e.g. for synthetic benchmarks"""
+        self._exchanges[exchange_key(method, url, request_body)] = (status, reason, list(headers), response_body)
+
+    def __len__(self):
+        return len(self._exchanges)
+
+    def request(self, method, url, body=None, headers=None, timeout=15):
+        exchange = self._exchanges.get(exchange_key(method, url, body))
+        with self._lock:
+            if exchange is None:
+                self.missing += 1
+            else:
+                self.replayed += 1
+        if exchange is None:
+            if self.fallback is not None:
+                return self.fallback.request(method, url, body=body, headers=headers, timeout=timeout)
+            raise LookupError(f'No recorded response for {method} {url}')
+
+        status, reason, header_items, response_body = exchange
+        if status >= 400:
+            raise _upstream.UpstreamHTTPError(status, reason, _message(header_items))
+        return ReplayResponse(status, reason, _message(header_items), response_body)
+
+    def stats(self):
+        with self._lock:
+            return {'replayed': self.replayed, 'missing': self.missing, 'fixtures': len(self._exchanges)}
+
+
+_BODY_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class Recorder:
+    """Passes requests to transport and saves each exchange to directory"""
+
+    def __init__(self, directory, transport=None):
+        self.directory = directory
+        self.transport = transport or _upstream.POOL
+        self.recorded = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def request(self, method, url, body=None, headers=None, timeout=15):
+        try:
+            response = self.transport.request(method, url, body=body, headers=headers, timeout=timeout)
+        except _upstream.UpstreamHTTPError as e:
+            self._save(method, url, body, e.status, e.reason, e.headers, b'')
+            raise
+        with response:
+            data = response.read()
+        self._save(method, url, body, response.status, response.reason, response.headers, data)
+        return ReplayResponse(response.status, response.reason, response.headers, data)
+
+    def _save(self, method, url, request_body, status, reason, headers, body):
+        key = exchange_key(method, url, request_body)
+        # The body is saved decoded, so its framing and encoding headers no longer apply
+        headers = [(name, value) for name, value in headers.items()
+                   if name.lower() not in _BODY_HEADERS] if headers is not None else []
+        meta = {
+            'method': method,
+            'url': url,
+            'request': request_body.decode('utf-8', 'replace') if request_body else None,
+            'status': status,
+            'reason': reason,
+            'headers': headers,
+            'body': f'{key}.body'
+        }
+        with open(os.path.join(self.directory, meta['body']), 'wb') as f:
+            f.write(body)
+        with open(os.path.join(self.directory, f'{key}.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        self.recorded += 1
+
+    def stats(self):
+        stats = self.transport.stats()
+        stats['recorded'] = self.recorded
+        return stats
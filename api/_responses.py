@@ -0,0 +1,186 @@
+"""
+Response encoding: compact JSON, content negotiation and validators.
+
+Results are serialized once, compactly, into an EncodedBody carrying a
+strong ETag derived from the comment IDs and like counts. Compressed
+(gzip, or brotli when the brotli package is installed) and pretty-printed
+variants are made on first use and kept with the body, so a cached
+response is compressed at most once per encoding.
+
+prepare() turns an EncodedBody and the request headers into the status,
+body and headers to send: 304 when If-None-Match matches, otherwise the
+best encoding the client accepts, with Vary and Cache-Control.
+"""
+import gzip
+import hashlib
+import json
+import threading
+
+from api import _model
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def dumps(obj):
+    """Compact JSON bytes"""
+    return _model.dumps(obj, separators=(',', ':')).encode()
+
+
+def _hash_comments(digest, comments):
+    if isinstance(comments, _model.CommentBatch):
+        digest.update('\0'.join(comments.comment_ids).encode())
+        digest.update(b'\1')
+        digest.update('\0'.join(comments.likes).encode())
+        for row, extra in sorted(comments.extras.items()):
+            if extra.get('replies'):
+                digest.update(b'[%d' % row)
+                _hash_comments(digest, extra['replies'])
+                digest.update(b']')
+        return
+    for comment in comments:
+        digest.update(f"{comment.get('comment_id')}\0{comment.get('likes')}\0".encode())
+        if comment.get('replies'):
+            digest.update(b'[')
+            _hash_comments(digest, comment['replies'])
+            digest.update(b']')
+
+
+def result_etag(result):
+    """
+    Strong ETag of a result: the comment IDs and like counts (replies
+    included) plus every top-level field other than the comments.
+    """
+    digest = hashlib.sha1()
+    meta = {key: value for key, value in result.items() if key != 'comments'}
+    digest.update(json.dumps(meta, sort_keys=True, default=str).encode())
+    _hash_comments(digest, result.get('comments') or ())
+    return '"' + digest.hexdigest() + '"'
+
+
+class EncodedBody:
+    """A compact JSON body, its ETag and lazily made variants of it"""
+
+    __slots__ = ('body', 'etag', '_variants', '_lock')
+
+    def __init__(self, body, etag=None):
+        self.body = body
+        self.etag = etag
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(dumps(result), result_etag(result))
+
+    def __len__(self):
+        return len(self.body)
+
+    def variant(self, encoding=None, pretty=False):
+        """The body, pretty-printed and/or content-encoded; memoized"""
+        if encoding is None and not pretty:
+            return self.body
+        key = (encoding, pretty)
+        data = self._variants.get(key)
+        if data is None:
+            data = self.body
+            if pretty:
+                data = self.variant(None, True) if encoding else json.dumps(json.loads(data), indent=2).encode()
+            if encoding == 'br':
+                data = brotli.compress(data, quality=BROTLI_QUALITY)
+            elif encoding == 'gzip':
+                data = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+            with self._lock:
+                self._variants[key] = data
+        return data
+
+    def variant_etag(self, encoding=None, pretty=False):
+        """The ETag of a variant; variants of one body share the base tag"""
+        if self.etag is None:
+            return None
+        suffix = ('-pretty' if pretty else '') + (f'-{encoding}' if encoding else '')
+        return self.etag[:-1] + suffix + '"'
+
+
+def accepted_encoding(accept_encoding):
+    """The preferred encoding in ENCODINGS that an Accept-Encoding header allows, or None"""
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+    best = None
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+def matched_etag(if_none_match, etag):
+    """
+    The entity tag in If-None-Match that matches etag or any of its
+    variants (weak comparison), without its W/ prefix; '*' if that is
+    what matched. None if nothing matches.
+    """
+    if not if_none_match or etag is None:
+        return None
+    base = etag.strip('"')
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return tag
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.strip('"').split('-', 1)[0] == base:
+            return tag
+    return None
+
+
+def prepare(encoded, request_headers, cache_control=None, pretty=False):
+    """
+    (status, body, headers) for an EncodedBody (or plain bytes).
+    request_headers needs .get(); cache_control is sent as is.
+    """
+    if not isinstance(encoded, EncodedBody):
+        encoded = EncodedBody(encoded)
+    headers = {'Vary': 'Accept-Encoding'}
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+
+    encoding = None
+    if len(encoded) >= MIN_COMPRESS_SIZE:
+        encoding = accepted_encoding(request_headers.get('Accept-Encoding')
+                                     or request_headers.get('accept-encoding'))
+
+    matched = matched_etag(request_headers.get('If-None-Match') or request_headers.get('if-none-match'),
+                           encoded.etag)
+    if matched is not None:
+        # Echo the variant the client holds; for * the one it would get now
+        headers['ETag'] = encoded.variant_etag(encoding, pretty) if matched == '*' else matched
+        return 304, b'', headers
+
+    body = encoded.variant(encoding, pretty)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if encoded.etag is not None:
+        headers['ETag'] = encoded.variant_etag(encoding, pretty)
+    return 200, body, headers
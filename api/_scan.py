@@ -0,0 +1,121 @@
+"""
+Streaming byte scanner for watch pages.
+
+Reads an HTTP response in chunks into a reusable bytearray and searches the
+raw bytes, so the page is never decoded to str and the socket can be closed
+as soon as the values we need have been seen.
+"""
+import re
+import threading
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Bytes kept from the end of the previous chunk so a match that straddles a
+# chunk boundary is still found. Must exceed the longest expected match.
+OVERLAP = 8 * 1024
+
+CONTINUATION_COMMAND_RE = re.compile(rb'"continuationCommand":\s*{\s*"token":\s*"([^"]+)"')
+ITEM_SECTION_CONTINUATION_RE = re.compile(
+    rb'"itemSectionContinuation":\s*{\s*"continuations":\s*\[\s*{\s*"nextContinuationData":\s*{\s*"continuation":\s*"([^"]+)"'
+)
+CONTINUATION_RE = re.compile(rb'"continuation":\s*"([^"]+)"')
+API_KEY_RE = re.compile(rb'"INNERTUBE_API_KEY":\s*"([^"]+)"')
+CLIENT_VERSION_RE = re.compile(rb'"INNERTUBE_CLIENT_VERSION":\s*"([^"]+)"')
+
+WATCH_PAGE_PATTERNS = {
+    'token': CONTINUATION_COMMAND_RE,
+    'api_key': API_KEY_RE,
+    'client_version': CLIENT_VERSION_RE,
+}
+
+_local = threading.local()
+
+
+def _buffer():
+    """Per-thread scan buffer, allocated once and reused across requests"""
+    buf = getattr(_local, 'buffer', None)
+    if buf is None:
+        buf = _local.buffer = bytearray(OVERLAP + CHUNK_SIZE)
+    return buf
+
+
+class Scanner:
+    """
+    Incremental scanner over a fixed-size window. Callers fill space()
+    with the next bytes of the body and report them with advance(), which
+    returns True once every required pattern has matched.
+
+    The sync path uses the per-thread buffer; asyncio callers, which share
+    a thread, should let each scanner allocate its own.
+    """
+
+    def __init__(self, patterns, required=None, buffer=None):
+        self.required = set(patterns if required is None else required)
+        self.pending = dict(patterns)
+        self.found = {}
+        self.buffer = buffer if buffer is not None else bytearray(OVERLAP + CHUNK_SIZE)
+        self.filled = 0
+        # Bytes before this offset have been searched for every pending
+        # pattern, so a new match must end after it and start at most
+        # OVERLAP before it
+        self.searched = 0
+
+    @property
+    def done(self):
+        return self.required.issubset(self.found) or not self.pending
+
+    def space(self):
+        """Writable view of the free part of the window"""
+        return memoryview(self.buffer)[self.filled:]
+
+    def advance(self, n):
+        """Account for n bytes written into space() and search them"""
+        buf = self.buffer
+        self.filled += n
+
+        start = max(0, self.searched - OVERLAP)
+        for name, regex in list(self.pending.items()):
+            match = regex.search(buf, start, self.filled)
+            if match:
+                self.found[name] = match.group(1).decode('ascii', 'replace')
+                del self.pending[name]
+
+        if self.done:
+            return True
+
+        if self.filled == len(buf):
+            # Slide the window: keep the tail so boundary matches survive
+            buf[:OVERLAP] = buf[self.filled - OVERLAP:self.filled]
+            self.filled = OVERLAP
+        self.searched = self.filled
+        return False
+
+
+def scan(response, patterns, required=None):
+    """
+    Search a response body for each regex in patterns (name -> compiled
+    bytes regex with one group) and return {name: first match as str}.
+
+    Reading stops as soon as every name in required (default: all of
+    patterns) has matched; the caller should then close the response.
+    """
+    scanner = Scanner(patterns, required, buffer=_buffer())
+    while True:
+        view = scanner.space()
+        try:
+            n = response.readinto(view)
+        finally:
+            view.release()
+        if not n or scanner.advance(n):
+            break
+    return scanner.found
+
+
+def scan_watch_page(response):
+    """
+    Scan a watch page for the comments continuation token and the ytcfg
+    values. Stops reading once the token is found; ytcfg appears near the
+    top of the page, so it is normally picked up on the way.
+    """
+    return scan(response, WATCH_PAGE_PATTERNS, required=('token',))
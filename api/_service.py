@@ -0,0 +1,390 @@
+"""
+The /comments service, shared by comments.handler and server.py.
+
+Everything between the HTTP server and the fetch engine lives here:
+reading the query parameters and batch bodies, selecting and filtering
+crawled comments into result dicts, the NDJSON lines of a streamed
+response, and the response cache. The crawls are _crawl step generators,
+so each server only runs them with its engine and writes the output.
+"""
+import json
+import os
+import re
+
+from api import _cache, _crawl, _filters, _metrics, _model, _responses, _singleflight, _tokens
+from api._crawl import FetchError
+
+
+# Hard ceiling for max_results; crawls of tens of thousands of comments are
+# expected, so this is well above a single innertube page (~20 threads).
+MAX_RESULTS_LIMIT = int(os.environ.get('COMMENTS_MAX_RESULTS_LIMIT', '50000'))
+
+# Replies per comment
+MAX_REPLIES_LIMIT = int(os.environ.get('COMMENTS_MAX_REPLIES_LIMIT', '1000'))
+
+# Batch endpoint limits: videos per request and concurrent fetches per batch.
+# Upstream concurrency per host is capped separately by the connection pool.
+BATCH_MAX_VIDEOS = int(os.environ.get('COMMENTS_BATCH_MAX_VIDEOS', '200'))
+BATCH_WORKERS = int(os.environ.get('COMMENTS_BATCH_WORKERS', '8'))
+# Request body fields of /comments/batch read like the /comments query
+BATCH_OPTIONS = ('max', 'order', 'replies', 'max_replies') + _filters.PARAMS
+
+
+def extract_video_id(url):
+    """Extract video ID from YouTube URL or return as-is if already an ID"""
+    patterns = [
+        r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([^&\n?#]+)',
+        r'youtube\.com\/watch\?.*v=([^&\n?#]+)'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+
+    # If it looks like a video ID, return it
+    if re.match(r'^[a-zA-Z0-9_-]{11}$', url):
+        return url
+
+    return None
+
+
+def parse_max_results(params):
+    """Read the max query parameter, clamped to MAX_RESULTS_LIMIT"""
+    try:
+        max_results = int(params.get('max', [50])[0])
+        return min(max_results, MAX_RESULTS_LIMIT)
+    except (ValueError, IndexError):
+        return 50
+
+
+def parse_order(params):
+    """Read the order query parameter (top or newest)"""
+    order = params.get('order', ['top'])[0]
+    return order if order in _tokens.ORDERS else 'top'
+
+
+def parse_max_replies(params):
+    """Replies to fetch per comment: 0 unless replies=1 is given"""
+    if params.get('replies', ['0'])[0] not in ('1', 'true'):
+        return 0
+    try:
+        max_replies = int(params.get('max_replies', [100])[0])
+        return max(1, min(max_replies, MAX_REPLIES_LIMIT))
+    except (ValueError, IndexError):
+        return 100
+
+
+def parse_filter(params):
+    """
+    sort/top/min_likes/author/q query parameters as a CommentFilter, or
+    None. Raises ValueError if they are invalid.
+    """
+    return _filters.from_params(params)
+
+
+def wants_ndjson(params):
+    """True if the client asked for newline-delimited JSON streaming"""
+    return (params.get('format', [''])[0] == 'ndjson'
+            or params.get('stream', ['0'])[0] in ('1', 'true'))
+
+
+def content_length(value):
+    """A Content-Length header value as an int (0 if absent), or None if it is invalid"""
+    if value is None:
+        return 0
+    try:
+        length = int(value)
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+def _flag(params, name):
+    return params.get(name, ['0'])[0] in ('1', 'true')
+
+
+def _query_value(value):
+    """A JSON body value as the query string would carry it: true is '1', 3.0 is '3'"""
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class CommentsRequest:
+    """
+    A GET /comments request read from its query parameters. error is the
+    message to answer with instead of fetching, or None; status is the
+    HTTP status of that answer.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.status = 200
+        url = params.get('url', [None])[0]
+        self.video_id = extract_video_id(url) if url else None
+        if not url:
+            self.error = 'Missing required parameter: url'
+        elif not self.video_id:
+            self.error = 'Invalid YouTube URL or video ID'
+        else:
+            self.error = None
+        self.max_results = parse_max_results(params)
+        self.order = parse_order(params)
+        self.max_replies = parse_max_replies(params)
+        try:
+            self.comment_filter = parse_filter(params)
+        except ValueError as e:
+            self.comment_filter = None
+            if self.error is None:
+                self.error, self.status = str(e), 400
+        self.ndjson = wants_ndjson(params)
+        self.sync = _flag(params, 'sync')
+        self.pretty = _flag(params, 'pretty')
+
+    @property
+    def cache_key(self):
+        """Response cache key: (video_id, max_results, order, max_replies, filter)"""
+        return (self.video_id, self.max_results, self.order, self.max_replies,
+                self.comment_filter.key if self.comment_filter else None)
+
+    def error_result(self):
+        return {'success': False, 'error': self.error}
+
+    def fetch(self):
+        """Steps of the fetch, returning its result dict"""
+        return fetch_result(self.video_id, self.max_results, self.order, self.max_replies, self.comment_filter)
+
+    def lines(self):
+        """Steps emitting the lines of a streamed response"""
+        return comment_lines(self.video_id, self.max_results, self.order, self.max_replies, self.comment_filter)
+
+
+class BatchRequest:
+    """
+    A POST /comments/batch body: {"videos": [url or id, ...]} plus any of
+    the /comments options (max, order, replies, sort, top, ...). error is
+    set if the body is invalid, with status 400.
+    """
+
+    def __init__(self, body):
+        self.error = None
+        self.status = 200
+        self.videos = []
+        self.video_ids = []
+        self.invalid = []
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            self.error, self.status = 'Invalid request body: not JSON', 400
+            return
+        if not isinstance(request, dict):
+            self.error, self.status = 'Invalid request body: expected a JSON object', 400
+            return
+        videos = request.get('videos') or []
+        if not isinstance(videos, list):
+            self.error, self.status = 'Invalid request body: videos must be a list', 400
+            return
+
+        params = {key: [_query_value(value)] for key, value in request.items() if key in BATCH_OPTIONS}
+        self.max_results = parse_max_results(params)
+        self.order = parse_order(params)
+        self.max_replies = parse_max_replies(params)
+        try:
+            self.comment_filter = parse_filter(params)
+        except ValueError as e:
+            self.error, self.status = str(e), 400
+            return
+
+        # Normalize and de-duplicate, keeping the request order
+        self.videos = videos
+        for video in videos[:BATCH_MAX_VIDEOS]:
+            video_id = extract_video_id(str(video))
+            if not video_id:
+                self.invalid.append(video)
+            elif video_id not in self.video_ids:
+                self.video_ids.append(video_id)
+
+    def error_result(self):
+        return {'success': False, 'error': self.error}
+
+    def fetch(self, video_id):
+        """Steps of one video's fetch, returning its result dict"""
+        return fetch_result(video_id, self.max_results, self.order, self.max_replies, self.comment_filter)
+
+    def invalid_lines(self):
+        """The lines for entries that are not videos, written first"""
+        return [{'success': False, 'error': 'Invalid YouTube URL or video ID', 'url': video}
+                for video in self.invalid]
+
+    def summary(self):
+        """The last line"""
+        return {
+            'success': True,
+            'videos': len(self.video_ids),
+            'invalid': len(self.invalid),
+            'truncated': len(self.videos) > BATCH_MAX_VIDEOS
+        }
+
+
+def error_result(video_id, error):
+    return {
+        'success': False,
+        'error': error,
+        'video_id': video_id
+    }
+
+
+def fetch_result(video_id, max_results=50, order='top', max_replies=0, comment_filter=None):
+    """
+    Steps (see _crawl) fetching YouTube comments for a video; returns the
+    result dict, whose 'comments' is always a _model.CommentBatch (see
+    plain_result). With a comment_filter (see _filters), only the comments
+    it selects are kept while crawling.
+    """
+    try:
+        # Step 1: Resolve the comments continuation token and fetch the first page
+        try:
+            first_page = yield (_crawl.FIRST, (video_id, order))
+        except FetchError as e:
+            _metrics.count_error(e)
+            return error_result(video_id, str(e))
+
+        if first_page is None:
+            return {
+                'success': True,
+                'video_id': video_id,
+                'comments': _model.CommentBatch(),
+                'message': 'No comments found (may be disabled)'
+            }
+
+        # Step 2: Page through the innertube API until max_results is reached
+        selection = (comment_filter or _filters.CommentFilter()).selection()
+        crawl = _crawl.Crawl(None, max_results, first_page, max_replies)
+        try:
+            while not crawl.done and not selection.done:
+                for comment in (yield from crawl.next_page()):
+                    selection.add(comment)
+                    if selection.done:
+                        break
+        except FetchError as e:
+            _metrics.count_error(e)
+            if not selection.scanned:
+                return error_result(video_id, str(e))
+            # Keep what we already crawled rather than throwing it away
+            return selection_result(video_id, selection, comment_filter, error=str(e))
+
+        return selection_result(video_id, selection, comment_filter)
+
+    except Exception as e:
+        _metrics.count_error(e)
+        return error_result(video_id, f'Unexpected error: {str(e)}')
+
+
+def selection_result(video_id, selection, comment_filter=None, error=None):
+    """Result dict for a finished (or, with error, interrupted) crawl"""
+    comments = selection.results()
+    result = {
+        'success': True,
+        'video_id': video_id,
+        'comments': comments,
+        'count': len(comments)
+    }
+    if comment_filter is not None:
+        result['scanned'] = selection.scanned
+    if error is not None:
+        result['partial'] = True
+        result['error'] = error
+    return result
+
+
+def plain_result(result):
+    """A fetch_result() result with its comments as a list of plain dicts"""
+    comments = result.get('comments')
+    if isinstance(comments, _model.CommentBatch):
+        result = dict(result, comments=comments.to_dicts())
+    return result
+
+
+def comment_lines(video_id, max_results=50, order='top', max_replies=0, comment_filter=None):
+    """
+    Steps emitting the NDJSON lines of a streamed /comments response: one
+    per comment as pages arrive, then a summary object with a 'success'
+    key (or an error object if the crawl failed). Comments a sorting
+    filter selects are emitted once the crawl has finished.
+    """
+    selection = (comment_filter or _filters.CommentFilter()).selection(keep=False)
+    count = 0
+    error = None
+    try:
+        first_page = yield (_crawl.FIRST, (video_id, order))
+        crawl = _crawl.Crawl(None, max_results, first_page, max_replies)
+        while not crawl.done and not selection.done:
+            for comment in (yield from crawl.next_page()):
+                if selection.add(comment) is not None:
+                    yield (_crawl.EMIT, comment)
+                    count += 1
+                if selection.done:
+                    break
+    except FetchError as e:
+        _metrics.count_error(e)
+        error = str(e)
+    except Exception as e:
+        _metrics.count_error(e)
+        error = f'Unexpected error: {str(e)}'
+
+    if selection.sorted:
+        for comment in selection.results():
+            yield (_crawl.EMIT, comment)
+            count += 1
+
+    if error is not None:
+        yield (_crawl.EMIT, {'success': False, 'error': error, 'video_id': video_id, 'count': count})
+        return
+
+    summary = {'success': True, 'video_id': video_id, 'count': count}
+    if comment_filter is not None:
+        summary['scanned'] = selection.scanned
+    yield (_crawl.EMIT, summary)
+
+
+def ndjson_line(obj):
+    """One compact NDJSON line"""
+    return _model.dumps(obj, separators=(',', ':')).encode() + b'\n'
+
+
+def encode_result(result):
+    """
+    Serialize a fetch result for the response cache as a compact
+    _responses.EncodedBody. Returns (body, size); size is None for errors
+    and partial crawls, which are returned but never cached and carry no
+    ETag.
+    """
+    cacheable = result.get('success') and not result.get('partial')
+    with _metrics.stage('serialize'):
+        if cacheable:
+            body = _responses.EncodedBody.from_result(result)
+        else:
+            body = _responses.EncodedBody(_responses.dumps(result))
+    return body, len(body) if cacheable else None
+
+
+def cache_control(body):
+    """Cache-Control for a /comments body: cacheable results follow the response cache TTLs"""
+    if getattr(body, 'etag', None) is None:
+        return 'no-store'
+    return f'public, max-age={int(RESPONSE_CACHE.ttl)}, stale-while-revalidate={int(RESPONSE_CACHE.stale_ttl)}'
+
+
+# Concurrent cache misses for the same response share one crawl
+REQUEST_FLIGHTS = _singleflight.SingleFlight()
+
+# Serialized /comments responses keyed by CommentsRequest.cache_key
+RESPONSE_CACHE = _cache.ResponseCache(
+    max_entries=int(os.environ.get('COMMENTS_CACHE_ENTRIES', '512')),
+    max_bytes=int(os.environ.get('COMMENTS_CACHE_BYTES', str(64 * 1024 * 1024))),
+    ttl=float(os.environ.get('COMMENTS_CACHE_TTL', '300')),
+    stale_ttl=float(os.environ.get('COMMENTS_CACHE_STALE_TTL', '3600'))
+)
@@ -0,0 +1,110 @@
+"""
+Single-flight call coalescing.
+
+Concurrent callers asking for the same key share one in-flight execution
+and its result (or exception) instead of each hitting the upstream.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncCall:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls per key, for threads (do) and for asyncio
+    tasks (do_async). Results are not kept once the call completes.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args):
+        """Run fn(*args), or wait for the call already running for key"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, coro_fn, *args):
+        """Await coro_fn(*args), or the task already running for key"""
+        loop = asyncio.get_running_loop()
+        # Tasks belong to one event loop, so calls are coalesced per loop
+        flight_key = (id(loop), key)
+        with self._lock:
+            call = self._async_calls.get(flight_key)
+            if call is None:
+                call = self._async_calls[flight_key] = _AsyncCall(loop.create_task(coro_fn(*args)))
+                call.task.add_done_callback(lambda task: self._forget(flight_key, call))
+                self.executions += 1
+            else:
+                self.coalesced += 1
+            call.waiters += 1
+
+        # The call runs in its own task that every caller shields, so a
+        # cancelled caller (the first one included) leaves the rest waiting
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # Nobody is left to use the result
+                self._forget(flight_key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, flight_key, call):
+        with self._lock:
+            if self._async_calls.get(flight_key) is call:
+                del self._async_calls[flight_key]
+
+    def stats(self):
+        """Return execution and coalesced call counters"""
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls) + len(self._async_calls)
+            }
@@ -0,0 +1,95 @@
+"""
+Static assets served from memory.
+
+An Asset reads its file once and keeps it as an EncodedBody with a
+content ETag and its compressed variants made up front, so a hit costs no
+file I/O and no compression. The file is re-read when its mtime or size
+changes; that check is one stat() at most every STATIC_CHECK_INTERVAL
+seconds (0 checks on every request).
+
+Responses go through _responses.prepare(), so they get the same
+negotiation as JSON: gzip (or brotli) when accepted, ETag, 304 on a
+matching If-None-Match, and Cache-Control.
+"""
+import hashlib
+import os
+import threading
+import time
+
+from api import _responses
+
+
+CHECK_INTERVAL = float(os.environ.get('STATIC_CHECK_INTERVAL', '1'))
+CACHE_CONTROL = 'public, max-age=300'
+
+# Uncompressed bodies at least this large are sent with sendfile by server.py
+SENDFILE_MIN_SIZE = 256 * 1024
+
+
+def _stamp(stat):
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Asset:
+    """One static file, cached in memory and reloaded when it changes"""
+
+    def __init__(self, path, content_type, cache_control=CACHE_CONTROL):
+        self.path = path
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self._body = None
+        self._stamp = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The file as an EncodedBody, or None if it does not exist"""
+        checked = self._checked
+        if checked is not None and time.monotonic() - checked < CHECK_INTERVAL:
+            return self._body
+        with self._lock:
+            if self._checked is checked:
+                self._refresh()
+                self._checked = time.monotonic()
+            return self._body
+
+    def _refresh(self):
+        try:
+            stamp = _stamp(os.stat(self.path))
+        except FileNotFoundError:
+            self._body = self._stamp = None
+            return
+        if stamp == self._stamp:
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+                # Stamp of what was read, in case the file changed since the stat()
+                stamp = _stamp(os.fstat(f.fileno()))
+        except FileNotFoundError:
+            self._body = self._stamp = None
+            return
+        body = _responses.EncodedBody(data, '"' + hashlib.sha1(data).hexdigest() + '"')
+        if len(body) >= _responses.MIN_COMPRESS_SIZE:
+            for encoding in _responses.ENCODINGS:
+                body.variant(encoding)
+        self._body, self._stamp = body, stamp
+
+    def open_unchanged(self, body):
+        """
+        The file opened for reading if body is large enough for sendfile
+        and the file still holds exactly body, otherwise None.
+        """
+        if len(body) < SENDFILE_MIN_SIZE or body is not self._body:
+            return None
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return None
+        if _stamp(os.fstat(f.fileno())) != self._stamp:
+            f.close()
+            return None
+        return f
+
+
+INDEX = Asset('public/index.html', 'text/html; charset=utf-8')
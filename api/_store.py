@@ -0,0 +1,97 @@
+"""
+Persistent comment store backed by SQLite (stdlib sqlite3, WAL mode)
+"""
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    comment_id TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    author TEXT,
+    text TEXT,
+    likes TEXT,
+    published TEXT,
+    first_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_comments_video ON comments (video_id, first_seen);
+CREATE INDEX IF NOT EXISTS idx_comments_published ON comments (video_id, published);
+"""
+
+COLUMNS = ('comment_id', 'author', 'text', 'likes', 'published')
+
+
+class CommentStore:
+    """
+    Comments keyed by commentId. Each thread gets its own connection;
+    WAL mode lets readers run while a sync is writing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def has(self, comment_id):
+        """True if the comment is already stored"""
+        row = self._connection().execute(
+            'SELECT 1 FROM comments WHERE comment_id = ?', (comment_id,)
+        ).fetchone()
+        return row is not None
+
+    def add(self, video_id, comments):
+        """
+        Store comments in one transaction. Comments are expected newest
+        first; first_seen decreases along the list so that order survives.
+        Existing rows keep their first_seen but get fresh likes and text.
+        Returns the number of comments written.
+        """
+        now = time.time()
+        rows = [
+            (comment['comment_id'], video_id, comment['author'], comment['text'],
+             comment['likes'], comment['published'], now - position * 1e-6)
+            for position, comment in enumerate(comments)
+        ]
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO comments (comment_id, video_id, author, text, likes, published, first_seen) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (comment_id) DO UPDATE SET '
+                'author = excluded.author, text = excluded.text, likes = excluded.likes, '
+                'published = excluded.published',
+                rows
+            )
+        return len(rows)
+
+    def comments(self, video_id, limit=50):
+        """Stored comments for a video, newest first"""
+        rows = self._connection().execute(
+            'SELECT comment_id, author, text, likes, published FROM comments '
+            'WHERE video_id = ? ORDER BY first_seen DESC LIMIT ?',
+            (video_id, limit)
+        ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def count(self, video_id):
+        """Number of stored comments for a video"""
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM comments WHERE video_id = ?', (video_id,)
+        ).fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
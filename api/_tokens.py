@@ -0,0 +1,66 @@
+"""
+Comments continuation tokens - synthesized from the video ID and cached
+"""
+from urllib.parse import quote
+import base64
+import os
+
+from api._cache import TTLCache
+
+
+# Comment orderings understood by the comments section ("sort by" menu)
+ORDERS = {'top': 0, 'newest': 1}
+
+# Tokens that produced a comments page, keyed by (video_id, order). An empty
+# string records that the video has no comments section.
+TOKEN_CACHE = TTLCache(
+    maxsize=int(os.environ.get('COMMENTS_TOKEN_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('COMMENTS_TOKEN_TTL', '21600'))
+)
+NO_COMMENTS_TTL = float(os.environ.get('COMMENTS_DISABLED_TTL', '600'))
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field_varint(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _field_bytes(number, value):
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def comments_section_token(video_id, order='top'):
+    """
+    Build the continuation token the watch page uses to load its comments
+    section, so the page itself does not have to be downloaded.
+
+    Protobuf layout:
+        2: {2: video_id}
+        3: 6
+        6: {4: {4: video_id, 6: sort, 15: 2}, 8: "comments-section"}
+    """
+    options = (
+        _field_bytes(4, video_id)
+        + _field_varint(6, ORDERS[order])
+        + _field_varint(15, 2)
+    )
+    params = _field_bytes(4, options) + _field_bytes(8, 'comments-section')
+    message = (
+        _field_bytes(2, _field_bytes(2, video_id))
+        + _field_varint(3, 6)
+        + _field_bytes(6, params)
+    )
+    return quote(base64.b64encode(message).decode('ascii'), safe='')
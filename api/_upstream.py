@@ -0,0 +1,422 @@
+"""
+Shared upstream HTTP client - keep-alive connection pool for YouTube requests
+"""
+from urllib.parse import urlsplit
+import functools
+import http.client
+import os
+import threading
+import time
+import zlib
+
+from api import _governor, _metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Sent on every upstream request unless the caller sets its own
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+
+# Compressed bytes read from the socket per decode step
+RAW_CHUNK_SIZE = 16 * 1024
+
+
+# Errors that mean a pooled keep-alive socket was closed by the server while
+# it sat idle; the request is retried once on a fresh connection.
+STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class UpstreamHTTPError(Exception):
+    """Raised for upstream responses with a 4xx/5xx status"""
+
+    def __init__(self, status, reason, headers=None):
+        super().__init__(f'HTTP Error {status}: {reason}')
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+
+
+def with_accept_encoding(headers):
+    """Request headers with ACCEPT_ENCODING added unless the caller set Accept-Encoding"""
+    headers = dict(headers or {})
+    if not any(name.lower() == 'accept-encoding' for name in headers):
+        headers['Accept-Encoding'] = ACCEPT_ENCODING
+    return headers
+
+
+class ContentDecoder:
+    """
+    Incremental decoder for a gzip, deflate or br Content-Encoding. feed()
+    compressed bytes, then take() decoded output in pieces of at most
+    max_length bytes, so the whole body is never inflated at once.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        # Compressed input for zlib; decoded output for brotli and after end()
+        self._buffer = b''
+        self._ended = False
+        if encoding == 'br':
+            self._brotli = brotli.Decompressor()
+            self._zlib = None
+        else:
+            # 16 + MAX_WBITS expects a gzip header; deflate is zlib-wrapped
+            # by the spec, but some servers send raw deflate (see take())
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS)
+            # Input before the first output, replayed if deflate turns out to be raw
+            self._head = b'' if encoding == 'deflate' else None
+
+    @classmethod
+    def for_headers(cls, headers):
+        """A decoder for the response's Content-Encoding, or None for identity"""
+        encoding = (headers.get('Content-Encoding') or headers.get('content-encoding') or '').strip().lower()
+        if encoding in ('gzip', 'x-gzip'):
+            return cls('gzip')
+        if encoding == 'deflate':
+            return cls('deflate')
+        if encoding == 'br' and brotli is not None:
+            return cls('br')
+        return None
+
+    def feed(self, data):
+        """Add compressed input"""
+        if self._zlib is None:
+            self._buffer += self._brotli.process(data)
+        else:
+            self._buffer += data
+            if self._head is not None:
+                self._head += data
+
+    def take(self, max_length):
+        """Up to max_length decoded bytes of what was fed so far (b'' if more input is needed)"""
+        if self._zlib is None or self._ended:
+            data, self._buffer = self._buffer[:max_length], self._buffer[max_length:]
+            return data
+        if not self._buffer or self._zlib.eof:
+            return b''
+        try:
+            data = self._zlib.decompress(self._buffer, max_length)
+        except zlib.error:
+            if self._head is None:
+                raise
+            # Raw deflate without the zlib header
+            self._zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self._zlib.decompress(self._head, max_length)
+        if data:
+            self._head = None
+        self._buffer = self._zlib.unconsumed_tail
+        return data
+
+    def end(self):
+        """Mark the input as complete; what is left to decode is then take()n as usual"""
+        if self._zlib is not None and not self._ended:
+            rest = self._zlib.decompress(self._buffer) if self._buffer and not self._zlib.eof else b''
+            self._buffer = rest + self._zlib.flush()
+        self._ended = True
+
+
+class PooledResponse:
+    """
+    Wraps an http.client.HTTPResponse. On close the connection goes back
+    to the pool if the body was fully read, otherwise it is discarded.
+    Compressed bodies are decoded incrementally as they are read;
+    bytes_read counts the bytes that came over the wire.
+    """
+
+    def __init__(self, pool, key, conn, response, slot=None, permit=None):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._slot = slot
+        self._permit = permit
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.bytes_read = 0
+        self._decoder = ContentDecoder.for_headers(response.headers)
+        self._finished = False
+
+    def read(self, amt=None):
+        if self._decoder is None:
+            data = self._response.read(amt)
+            self.bytes_read += len(data)
+            return data
+        if amt is None:
+            parts = []
+            while True:
+                part = self._decode(RAW_CHUNK_SIZE * 4)
+                if not part:
+                    return b''.join(parts)
+                parts.append(part)
+        return self._decode(amt)
+
+    def readinto(self, buffer):
+        if self._decoder is None:
+            count = self._response.readinto(buffer)
+            self.bytes_read += count
+            return count
+        data = self._decode(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _decode(self, amt):
+        """Up to amt decoded bytes; b'' only at the end of the body"""
+        while True:
+            data = self._decoder.take(amt)
+            if data or self._finished:
+                return data
+            raw = self._response.read(RAW_CHUNK_SIZE)
+            self.bytes_read += len(raw)
+            if not raw:
+                self._finished = True
+                self._decoder.end()
+                return self._decoder.take(amt)
+            self._decoder.feed(raw)
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        _metrics.count_response(self.status, self.bytes_read)
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._release(self._key, conn)
+        else:
+            self._response.close()
+            conn.close()
+        if self._slot is not None:
+            self._slot.release()
+        if self._permit is not None:
+            self._permit(self.status)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Keep-alive connection pool keyed by (scheme, host, port).
+    Keeps at most max_per_host idle connections per host and evicts
+    connections that have been idle for longer than idle_timeout seconds.
+    If max_in_flight is set, at most that many requests per host are open
+    at once; further callers block until a response is closed. A governor
+    (see _governor.py) adds an adaptive rate and concurrency limit on top,
+    and retries 429/5xx responses after a backoff.
+    """
+
+    def __init__(self, max_per_host=8, idle_timeout=30.0, max_in_flight=None, governor=None):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.max_in_flight = max_in_flight
+        self.governor = governor
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+
+    def request(self, method, url, body=None, headers=None, timeout=15):
+        """
+        Send a request and return a PooledResponse.
+        Raises UpstreamHTTPError for 4xx/5xx responses.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        governor = self.governor
+        if governor is None:
+            return self._request(key, method, path, body, headers, timeout)
+
+        attempt = 0
+        while True:
+            governor.acquire(parts.hostname, timeout)
+            try:
+                return self._request(key, method, path, body, headers, timeout,
+                                     functools.partial(governor.release, parts.hostname))
+            except UpstreamHTTPError as e:
+                retry_after = _governor.retry_after_seconds(e.headers)
+                governor.release(parts.hostname, e.status, retry_after)
+                if e.status not in _governor.RETRY_STATUSES or attempt >= governor.max_retries:
+                    raise
+            except Exception:
+                governor.release(parts.hostname)
+                raise
+            attempt += 1
+            time.sleep(governor.retry_delay(parts.hostname, attempt, retry_after))
+
+    def _request(self, key, method, path, body, headers, timeout, permit=None):
+        headers = with_accept_encoding(headers)
+        slot = self._slot(key)
+        if slot is not None:
+            slot.acquire()
+        try:
+            conn, response = self._send(key, method, path, body, headers, timeout)
+        except Exception:
+            if slot is not None:
+                slot.release()
+            raise
+
+        if response.status >= 400:
+            # Drain small error bodies so the connection can be reused; the
+            # caller returns the permit with the error status
+            pooled = PooledResponse(self, key, conn, response, slot)
+            try:
+                response.read()
+            finally:
+                pooled.close()
+            raise UpstreamHTTPError(response.status, response.reason, response.headers)
+        return PooledResponse(self, key, conn, response, slot, permit)
+
+    def _send(self, key, method, path, body, headers, timeout):
+        conn, reused = self._acquire(key, timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            return conn, conn.getresponse()
+        except STALE_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        # The server closed the idle socket; retry once on a new one
+        with self._lock:
+            self.reconnects += 1
+        conn = self._connect(key, timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def _slot(self, key):
+        if not self.max_in_flight:
+            return None
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = threading.BoundedSemaphore(self.max_in_flight)
+            return slot
+
+    def stats(self):
+        """Return pool counters and the number of idle connections"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reconnects': self.reconnects,
+                'evictions': self.evictions,
+                'idle': sum(len(conns) for conns in self._idle.values())
+            }
+
+    def clear(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def _acquire(self, key, timeout):
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self._lock:
+            conns = self._idle.get(key, [])
+            # Most recently used connections are at the end of the list
+            while conns:
+                candidate, released_at = conns.pop()
+                if now - released_at > self.idle_timeout:
+                    stale.append(candidate)
+                    self.evictions += 1
+                    continue
+                conn = candidate
+                break
+            # Everything left is older than what we just looked at
+            for candidate, released_at in conns[:]:
+                if now - released_at > self.idle_timeout:
+                    conns.remove((candidate, released_at))
+                    stale.append(candidate)
+                    self.evictions += 1
+            if conn is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        for candidate in stale:
+            candidate.close()
+
+        if conn is None:
+            return self._connect(key, timeout), False
+
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _connect(self, key, timeout):
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _release(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.max_per_host:
+                conns.append((conn, time.monotonic()))
+                return
+            self.evictions += 1
+        conn.close()
+
+
+POOL = ConnectionPool(
+    max_per_host=int(os.environ.get('UPSTREAM_POOL_SIZE', '8')),
+    idle_timeout=float(os.environ.get('UPSTREAM_POOL_IDLE_TIMEOUT', '30')),
+    max_in_flight=int(os.environ.get('UPSTREAM_MAX_IN_FLIGHT', '16')) or None,
+    governor=_governor.GOVERNOR
+)
+
+
+def request(method, url, body=None, headers=None, timeout=15):
+    """Send a request through the shared connection pool"""
+    return POOL.request(method, url, body=body, headers=headers, timeout=timeout)
+
+
+def pool_stats():
+    """Hit/miss counters of the shared connection pool"""
+    return POOL.stats()
+
+
+def governor_stats():
+    """Per-host limits and throttling counters of the shared governor"""
+    return _governor.GOVERNOR.stats()
+
+
+def install(transport):
+    """
+    Send request() through another transport, such as a
+    _replay.ReplayTransport. Returns the one it replaces.
+    """
+    global POOL
+    previous, POOL = POOL, transport
+    return previous
@@ -0,0 +1,79 @@
+"""
+Compare json.loads + parse with the incremental scanner + parse.
+
+    python -m bench.jsonscan_bench [response.json ...]
+
+Without arguments, a synthetic entity-layout page padded with unrelated
+renderer data is used. Prints time per page and tracemalloc peak.
+"""
+import argparse
+import io
+import json
+import os
+import time
+import tracemalloc
+
+from api import _jsonscan, _parse
+from bench import payloads
+
+
+def padded_page(per_page=20, padding=2000):
+    """A synthetic page with a UI tree around the comments, like real ones"""
+    page = payloads.entity_page(per_page=per_page)
+    page['responseContext'] = {'serviceTrackingParams': [
+        {'service': 'GFEEDBACK', 'params': [{'key': f'e{i}', 'value': 'x' * 40} for i in range(20)]}
+    ]}
+    page['frameworkUpdates']['entityBatchUpdate']['mutations'].extend(
+        {'entityKey': f'k{i}', 'payload': {'engagementToolbarSurfaceEntityPayload': {
+            'key': f'k{i}', 'likeCommand': {'innertubeCommand': {'clickTrackingParams': 'c' * 80}}
+        }}}
+        for i in range(padding)
+    )
+    return page
+
+
+def with_loads(raw):
+    return _parse.parse_page(json.loads(raw.decode('utf-8')))
+
+
+def with_scanner(raw):
+    return _parse.parse_page(_jsonscan.scan_page(io.BytesIO(raw), min_scan_size=0))
+
+
+def measure(fn, raw, rounds=20):
+    """(best milliseconds per call, tracemalloc peak in KiB)"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(raw)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1e3, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark incremental JSON scanning')
+    parser.add_argument('files', nargs='*', help='Recorded /next responses (JSON)')
+    args = parser.parse_args()
+
+    if args.files:
+        bodies = []
+        for path in args.files:
+            with open(path, 'rb') as f:
+                bodies.append((os.path.basename(path), f.read()))
+    else:
+        bodies = [('synthetic padded', json.dumps(padded_page()).encode('utf-8'))]
+
+    print(f'{"page":<20} {"bytes":>9} {"loads ms":>9} {"loads KiB":>10} {"scan ms":>8} {"scan KiB":>9}')
+    for name, raw in bodies:
+        assert with_loads(raw) == with_scanner(raw), name
+        loads_ms, loads_peak = measure(with_loads, raw)
+        scan_ms, scan_peak = measure(with_scanner, raw)
+        print(f'{name:<20} {len(raw):>9} {loads_ms:>9.2f} {loads_peak:>10.0f} {scan_ms:>8.2f} {scan_peak:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Open-loop load generator for the /comments endpoint.
+
+    python -m bench.load [--target http://127.0.0.1:8000] [--rps 50]
+                         [--duration 30] [--videos 20] [--max 100]
+                         [--mock http://127.0.0.1:9000]
+
+Sends GET /comments at a fixed rate, whatever the response times, to
+either server.py or `vercel dev`. Requests cycle through --videos
+distinct IDs, so lower it to exercise the caches. Reports latency
+percentiles, throughput and failures. With --mock (see mock_youtube.py)
+it also reports how many upstream calls the run cost.
+
+Run both against the mock for repeatable numbers:
+
+    python mock_youtube.py --latency 80 --jitter 30 &
+    YOUTUBE_BASE_URL=http://127.0.0.1:9000 python server.py &
+    python -m bench.load --rps 100 --mock http://127.0.0.1:9000
+"""
+from urllib.parse import urlencode
+import argparse
+import asyncio
+import json
+import time
+
+from api import _aio, _tokens
+from api._upstream import UpstreamHTTPError
+
+
+def video_ids(count):
+    """count distinct 11-character video IDs"""
+    return [f'load{index:07d}' for index in range(count)]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def get_json(pool, url, timeout):
+    response = await pool.request('GET', url, timeout=timeout)
+    async with response:
+        return json.loads(await asyncio.wait_for(response.read(), timeout))
+
+
+async def one_request(pool, url, timeout, results):
+    started = time.perf_counter()
+    try:
+        body = await get_json(pool, url, timeout)
+        outcome = 'ok' if body.get('success') else 'failed'
+    except UpstreamHTTPError as e:
+        outcome = f'http_{e.status}'
+    except asyncio.TimeoutError:
+        outcome = 'timeout'
+    except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError):
+        outcome = 'connection_error'
+    results.append((time.perf_counter() - started, outcome))
+
+
+async def mock_stats(pool, mock_url):
+    if not mock_url:
+        return None
+    try:
+        return await get_json(pool, f'{mock_url}/__stats', 5)
+    except Exception:
+        return None
+
+
+async def run(target, rps, duration, videos, params, timeout, mock_url=None):
+    """Send rps requests per second for duration seconds; returns a report dict"""
+    pool = _aio.AsyncConnectionPool(max_per_host=1024, idle_timeout=60)
+    before = await mock_stats(pool, mock_url)
+
+    ids = video_ids(videos)
+    results = []
+    tasks = []
+    total = int(rps * duration)
+    started = time.perf_counter()
+    for index in range(total):
+        # Open loop: request i goes out at i / rps even if earlier ones are slow
+        delay = started + index / rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        query = urlencode(dict(params, url=ids[index % len(ids)]))
+        tasks.append(asyncio.ensure_future(one_request(pool, f'{target}/comments?{query}', timeout, results)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    after = await mock_stats(pool, mock_url)
+    pool.close()
+
+    latencies = sorted(latency for latency, outcome in results if outcome == 'ok')
+    outcomes = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    report = {
+        'requests': len(results),
+        'elapsed': elapsed,
+        'throughput': outcomes.get('ok', 0) / elapsed if elapsed else 0.0,
+        'outcomes': outcomes,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0
+    }
+    if before is not None and after is not None:
+        report['upstream'] = {name: after[name] - before.get(name, 0) for name in after}
+    return report
+
+
+def print_report(report, rps):
+    print(f'{report["requests"]} requests in {report["elapsed"]:.1f}s (target {rps:g} rps)')
+    print(f'throughput  {report["throughput"]:.1f} ok/s')
+    print('outcomes    ' + ', '.join(f'{name}={count}' for name, count in sorted(report['outcomes'].items())))
+    print(f'latency ms  p50={report["p50"] * 1000:.1f} p95={report["p95"] * 1000:.1f} '
+          f'p99={report["p99"] * 1000:.1f} max={report["max"] * 1000:.1f}')
+    upstream = report.get('upstream')
+    if upstream:
+        calls = upstream.get('watch', 0) + upstream.get('next', 0) + upstream.get('replies', 0)
+        print(f'upstream    {calls} calls ({calls / max(1, report["requests"]):.2f}/request): '
+              + ', '.join(f'{name}={count}' for name, count in upstream.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive /comments at a fixed request rate')
+    parser.add_argument('--target', default='http://127.0.0.1:8000', help='Server base URL')
+    parser.add_argument('--rps', type=float, default=50.0, help='Requests per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to send for')
+    parser.add_argument('--videos', type=int, default=20, help='Distinct video IDs to cycle through')
+    parser.add_argument('--max', type=int, default=100, help='max parameter of each request')
+    parser.add_argument('--order', default='top', choices=sorted(_tokens.ORDERS))
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--mock', help='mock_youtube.py base URL, to count upstream calls')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    params = {'max': args.max, 'order': args.order}
+    report = asyncio.run(run(args.target.rstrip('/'), args.rps, args.duration, args.videos, params,
+                             args.timeout, args.mock and args.mock.rstrip('/')))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.rps)
+
+
+if __name__ == '__main__':
+    main()
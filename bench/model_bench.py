@@ -0,0 +1,60 @@
+"""
+Memory of a crawl held as dicts, as Comment objects and as a CommentBatch.
+
+    python -m bench.model_bench [--sizes 10000,100000,1000000]
+
+Comments are generated the way the parser produces them: every string is
+a fresh object, even when its value repeats (authors, likes, times).
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from api import _model
+
+
+def generate(count):
+    for i in range(count):
+        likes = i * 7919 % 25000
+        yield {
+            'comment_id': f'Ugx{i:012d}',
+            'author': f'@viewer{i % (count // 4 + 1)}',
+            'text': f'Comment {i}: ' + 'some words here ' * (1 + i % 5),
+            'likes': f'{likes / 1000:.1f}K' if likes >= 1000 else f'{likes}',
+            'published': f'{1 + i % 30} days ago'
+        }
+
+
+def measure(build, count):
+    """(tracemalloc MiB held by the built container, seconds to build)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = build(generate(count))
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return current / (1024 * 1024), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark comment record memory')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma separated comment counts')
+    args = parser.parse_args()
+
+    builders = [
+        ('dicts', list),
+        ('Comment', lambda comments: [_model.Comment.from_dict(comment) for comment in comments]),
+        ('CommentBatch', _model.CommentBatch),
+    ]
+    print(f'{"comments":>9} {"layout":<13} {"MiB":>9} {"bytes/row":>10} {"build s":>8}')
+    for count in (int(size) for size in args.sizes.split(',')):
+        for name, build in builders:
+            mib, elapsed = measure(build, count)
+            print(f'{count:>9} {name:<13} {mib:>9.1f} {mib * 1024 * 1024 / count:>10.0f} {elapsed:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
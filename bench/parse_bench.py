@@ -0,0 +1,49 @@
+"""
+Micro-benchmark for the comment page parser.
+
+    python -m bench.parse_bench [response.json ...] [--max N]
+
+Without arguments, synthetic pages in both layouts are used. Prints the
+per-page parse time for a full parse and for a parse capped at --max.
+"""
+import argparse
+import os
+import timeit
+
+from api import _parse
+from bench import payloads
+
+
+def time_page(api_data, max_results=None, repeat=5):
+    """Best per-call time in microseconds"""
+    timer = timeit.Timer(lambda: _parse.parse_page(api_data, max_results, {}))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark comment page parsing')
+    parser.add_argument('files', nargs='*', help='Recorded /next responses (JSON)')
+    parser.add_argument('--max', type=int, default=5, help='max_results for the capped parse')
+    parser.add_argument('--per-page', type=int, default=20, help='Comments per synthetic page')
+    args = parser.parse_args()
+
+    if args.files:
+        pages = [(os.path.basename(path), payloads.load(path)) for path in args.files]
+    else:
+        pages = [
+            ('synthetic entity', payloads.entity_page(per_page=args.per_page)),
+            ('synthetic renderer', payloads.renderer_page(per_page=args.per_page)),
+        ]
+
+    print(f'{"page":<28} {"schema":<10} {"comments":>8} {"full us":>10} {"max=" + str(args.max) + " us":>10}')
+    for name, api_data in pages:
+        comments, _ = _parse.parse_page(api_data)
+        schema = _parse.detect_schema(api_data) or '-'
+        full = time_page(api_data)
+        capped = time_page(api_data, args.max)
+        print(f'{name:<28} {schema:<10} {len(comments):>8} {full:>10.1f} {capped:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Synthetic innertube /next responses shaped like the real ones, for
+benchmarks. Recorded responses (see save_response.py) can be used instead.
+"""
+import json
+
+
+def comment_text(index):
+    return f'Comment number {index} - ' + 'lorem ipsum dolor sit amet ' * (1 + index % 6)
+
+
+def entity_page(page=0, per_page=20, next_token='next-page-token', replies=True):
+    """A page in the commentViewModel / commentEntityPayload layout"""
+    items = []
+    mutations = []
+    for i in range(per_page):
+        comment_id = f'Ugx{page:04d}{i:04d}'
+        thread = {'commentViewModel': {'commentViewModel': {'commentId': comment_id, 'commentKey': 'k' * 60}}}
+        if replies and i % 4 == 0:
+            thread['replies'] = {'commentRepliesRenderer': {'contents': [{'continuationItemRenderer': {
+                'continuationEndpoint': {'continuationCommand': {'token': 'replies-' + comment_id}}
+            }}]}}
+        items.append({'commentThreadRenderer': thread})
+
+        mutations.append({'entityKey': 'k' * 60, 'type': 'ENTITY_MUTATION_TYPE_REPLACE', 'payload': {
+            'commentEntityPayload': {
+                'properties': {
+                    'commentId': comment_id,
+                    'content': {'content': comment_text(i)},
+                    'publishedTime': f'{1 + i % 11} days ago',
+                    'authorButtonA11y': f'@viewer{i}',
+                    'toolbar': {'likeCountNotliked': f'{i * 37 % 2000}', 'replyCount': str(i % 5)}
+                },
+                'author': {'channelId': 'UC' + 'x' * 22, 'displayName': f'@viewer{i}',
+                           'avatarThumbnailUrl': f'https://yt3.ggpht.com/avatar{i}=s88'}
+            }
+        }})
+        # Real pages interleave per-comment toolbar and surface entities
+        mutations.append({'entityKey': 't' * 60, 'type': 'ENTITY_MUTATION_TYPE_REPLACE', 'payload': {
+            'engagementToolbarStateEntityPayload': {'key': 't' * 60, 'likeState': 'TOGGLE_STATE_OFF'}
+        }})
+
+    if next_token:
+        items.append({'continuationItemRenderer': {
+            'continuationEndpoint': {'continuationCommand': {'token': next_token}}
+        }})
+    return {
+        'onResponseReceivedEndpoints': [{'appendContinuationItemsAction': {'continuationItems': items}}],
+        'frameworkUpdates': {'entityBatchUpdate': {'mutations': mutations}}
+    }
+
+
+def renderer_page(page=0, per_page=20, next_token='next-page-token'):
+    """A page in the older inline commentRenderer layout"""
+    items = []
+    for i in range(per_page):
+        items.append({'commentThreadRenderer': {'comment': {'commentRenderer': {
+            'commentId': f'Ugx{page:04d}{i:04d}',
+            'authorText': {'simpleText': f'@viewer{i}'},
+            'authorThumbnail': {'thumbnails': [{'url': f'https://yt3.ggpht.com/avatar{i}=s88'}]},
+            'contentText': {'runs': [{'text': comment_text(i)}]},
+            'publishedTimeText': {'runs': [{'text': f'{1 + i % 11} days ago'}]},
+            'voteCount': {'simpleText': f'{i * 37 % 2000}'}
+        }}}})
+    if next_token:
+        items.append({'continuationItemRenderer': {
+            'continuationEndpoint': {'continuationCommand': {'token': next_token}}
+        }})
+    return {'onResponseReceivedEndpoints': [{'appendContinuationItemsAction': {'continuationItems': items}}]}
+
+
+def watch_page(token='watch-page-token', size=1024 * 1024):
+    """Watch page HTML of about size bytes with ytcfg and the comments token"""
+    filler = '<div class="style-scope ytd-app">' + 'x' * 200 + '</div>\n'
+    head = ('<!DOCTYPE html><html><head><script>ytcfg.set({"INNERTUBE_API_KEY":"AIzaSyFakeKeyForBenchmarks000000000",'
+            '"INNERTUBE_CLIENT_VERSION":"2.20240101.00.00"});</script></head><body>')
+    data = ('var ytInitialData = {"contents":{"itemSectionRenderer":{"contents":[{"continuationItemRenderer":'
+            '{"continuationEndpoint":{"continuationCommand":{"token":"' + token + '"}}}}]}}};')
+    # ytInitialData sits well into the page, after most of the markup
+    before = filler * int(size * 0.7 / len(filler))
+    after = filler * int(size * 0.3 / len(filler))
+    return (head + before + '<script>' + data + '</script>' + after + '</body></html>').encode('utf-8')
+
+
+def load(path):
+    """Load a recorded /next response"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
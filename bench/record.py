@@ -0,0 +1,48 @@
+"""
+Record live YouTube responses as replay fixtures.
+
+    python -m bench.record VIDEO [VIDEO ...] [--out bench/fixtures] [--max 100] [--order top]
+
+For each video the watch page and every innertube /next page of a crawl
+of --max comments are saved. Replay them with bench.suite --fixtures or
+_replay.ReplayTransport.
+"""
+import argparse
+import json
+
+from api import _replay, _upstream, comments
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record watch pages and /next responses as fixtures')
+    parser.add_argument('videos', nargs='+', help='YouTube URLs or video IDs')
+    parser.add_argument('--out', default='bench/fixtures', help='Fixtures directory')
+    parser.add_argument('--max', type=int, default=100, help='Comments to crawl per video')
+    parser.add_argument('--order', choices=('top', 'newest'), default='top')
+    args = parser.parse_args()
+
+    recorder = _replay.Recorder(args.out)
+    _upstream.install(recorder)
+
+    manifest = []
+    for video in args.videos:
+        video_id = comments.extract_video_id(video)
+        if not video_id:
+            print(f'Skipping {video}: not a YouTube URL or video ID')
+            continue
+        # The crawl uses a synthesized token; fetch the page for the scanner benchmarks
+        try:
+            comments.fetch_continuation_token(video_id)
+        except comments.FetchError as e:
+            print(f'{video_id}: watch page failed: {e}')
+        result = comments.fetch_youtube_comments(video_id, args.max, args.order)
+        print(f'{video_id}: {result.get("count", 0)} comments, {recorder.recorded} exchanges recorded so far')
+        manifest.append({'video_id': video_id, 'order': args.order, 'max': args.max,
+                         'count': result.get('count', 0)})
+
+    with open(f'{args.out}/manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
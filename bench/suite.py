@@ -0,0 +1,183 @@
+"""
+Offline benchmark suite for the parse and serve path.
+
+    python -m bench.suite [--fixtures bench/fixtures] [--save-baseline FILE]
+                          [--compare FILE] [--threshold 0.2]
+
+Measures, per page: token extraction from the watch page, JSON parsing
+(json.loads and the incremental scanner), comment normalization and
+response serialization (JSON and NDJSON). Also measures a full crawl
+replayed through _replay.ReplayTransport. Uses recorded fixtures (see
+bench.record) or synthetic pages if none are given.
+
+--save-baseline writes the results as JSON. --compare reads a baseline,
+flags every benchmark more than --threshold slower, and exits with
+status 1 if any regressed.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import timeit
+from urllib.parse import urlsplit
+
+from api import _innertube, _jsonscan, _model, _parse, _replay, _scan, _tokens, _upstream, comments
+from bench import payloads
+
+
+SYNTHETIC_VIDEO_ID = 'dQw4w9WgXcQ'
+SYNTHETIC_PAGES = 5
+
+
+class Corpus:
+    """Watch pages, /next bodies and a replay transport to run against"""
+
+    def __init__(self, watch_pages, next_bodies, transport, videos):
+        self.watch_pages = watch_pages
+        self.next_bodies = next_bodies
+        self.transport = transport
+        # [(video_id, order, max_results)] crawls the transport can replay
+        self.videos = videos
+
+
+def load_fixtures(directory):
+    transport = _replay.ReplayTransport(directory)
+    watch_pages = []
+    next_bodies = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json') or name == 'manifest.json':
+            continue
+        with open(os.path.join(directory, name), 'r') as f:
+            meta = json.load(f)
+        if meta['status'] != 200:
+            continue
+        with open(os.path.join(directory, meta['body']), 'rb') as f:
+            body = f.read()
+        path = urlsplit(meta['url']).path
+        if path == '/watch':
+            watch_pages.append(body)
+        elif path.endswith('/next'):
+            next_bodies.append(body)
+
+    videos = []
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            videos = [(entry['video_id'], entry['order'], entry['max']) for entry in json.load(f)]
+    return Corpus(watch_pages, next_bodies, transport, videos)
+
+
+def synthetic_corpus():
+    transport = _replay.ReplayTransport()
+    next_bodies = []
+    token = _tokens.comments_section_token(SYNTHETIC_VIDEO_ID, 'top')
+    for page in range(SYNTHETIC_PAGES):
+        next_token = f'page-{page + 1}' if page + 1 < SYNTHETIC_PAGES else None
+        body = json.dumps(payloads.entity_page(page, next_token=next_token)).encode('utf-8')
+        request = json.dumps({'context': {}, 'continuation': token}).encode('utf-8')
+        transport.add('POST', _innertube.NEXT_URL, request, body)
+        next_bodies.append(body)
+        token = next_token
+    watch_pages = [payloads.watch_page()]
+    return Corpus(watch_pages, next_bodies, transport, [(SYNTHETIC_VIDEO_ID, 'top', 20 * SYNTHETIC_PAGES)])
+
+
+def per_call(fn, repeat=5):
+    """Best seconds per call of fn()"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def per_page(fn, items):
+    """Mean of the best per-call time of fn(item) over items"""
+    return sum(per_call(lambda item=item: fn(item)) for item in items) / len(items)
+
+
+def run(corpus):
+    """{benchmark name: seconds per page (or per crawl)}"""
+    results = {}
+    pages = [_jsonscan.scan_page(io.BytesIO(body)) for body in corpus.next_bodies]
+    parsed = [_parse.parse_page(page)[0] for page in pages]
+    batches = [_model.CommentBatch(page_comments) for page_comments in parsed]
+
+    if corpus.watch_pages:
+        results['token_extraction'] = per_page(lambda html: _scan.scan_watch_page(io.BytesIO(html)),
+                                               corpus.watch_pages)
+    if corpus.next_bodies:
+        results['json_loads'] = per_page(lambda body: json.loads(body.decode('utf-8')), corpus.next_bodies)
+        # The scanner itself; scan_page hands small bodies to json.loads
+        results['json_scan'] = per_page(lambda body: _jsonscan.scan_page(io.BytesIO(body), min_scan_size=0),
+                                        corpus.next_bodies)
+        results['normalize'] = per_page(_parse.parse_page, pages)
+        results['serialize_json'] = per_page(
+            lambda batch: comments.encode_result({'success': True, 'video_id': 'x', 'comments': batch,
+                                                  'count': len(batch)}), batches)
+        results['serialize_ndjson'] = per_page(lambda batch: b''.join(batch.iter_ndjson()), batches)
+
+    if corpus.videos:
+        previous = _upstream.install(corpus.transport)
+        config = _innertube.CONFIG.get()
+        # Keep the config fresh so nothing tries to refresh it from the network
+        _innertube.CONFIG.update(config['api_key'], config['client_version'])
+        try:
+            def crawl(video):
+                video_id, order, max_results = video
+                _tokens.TOKEN_CACHE.clear()
+                result = comments.fetch_youtube_comments(video_id, max_results, order)
+                if not result.get('success'):
+                    raise RuntimeError(f'Replay of {video_id} failed: {result.get("error")}')
+            results['crawl_replay'] = per_page(crawl, corpus.videos)
+        finally:
+            _upstream.install(previous)
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print results against a baseline; returns the names that regressed"""
+    regressed = []
+    print(f'{"benchmark":<18} {"us":>10} {"baseline":>10} {"change":>8}')
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base:
+            change = seconds / base - 1
+            flag = '  REGRESSION' if change > threshold else ''
+            if flag:
+                regressed.append(name)
+            print(f'{name:<18} {seconds * 1e6:>10.1f} {base * 1e6:>10.1f} {change:>+8.1%}{flag}')
+        else:
+            print(f'{name:<18} {seconds * 1e6:>10.1f} {"-":>10} {"-":>8}')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the offline parse/serve benchmarks')
+    parser.add_argument('--fixtures', help='Recorded fixtures directory (default: synthetic pages)')
+    parser.add_argument('--save-baseline', metavar='FILE', help='Write the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='Compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Slowdown flagged as a regression')
+    args = parser.parse_args()
+
+    corpus = load_fixtures(args.fixtures) if args.fixtures else synthetic_corpus()
+    results = run(corpus)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+    regressed = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'fixtures': args.fixtures or 'synthetic', 'python': sys.version.split()[0],
+                       'results': results}, f, indent=2)
+
+    if regressed:
+        print(f'{len(regressed)} benchmark(s) regressed by more than {args.threshold:.0%}: {", ".join(regressed)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Bulk export of video comments to rotating NDJSON or CSV files.
+
+    python export.py VIDEO [VIDEO ...] [--out exports] [--format ndjson|csv] [--gzip]
+                     [--order top|newest] [--replies] [--max N]
+                     [--rotate-rows N] [--flush-rows N] [--workers N] [--restart]
+
+Each video is written to <out>/<video_id>/part-00000.ndjson (or .csv, plus
+.gz with --gzip), starting a new part every --rotate-rows rows. Rows are
+buffered and written --flush-rows at a time. After every write
+checkpoint.json records the continuation token of the next page and the
+size of the current part. An interrupted export run again with the same
+options truncates the part to that size and resumes from the token.
+Finished videos are skipped unless --restart is given.
+
+Prints one JSON summary line per video; exits with status 1 if any failed.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import csv
+import glob
+import gzip
+import io
+import json
+import os
+import sys
+
+from api import _model, comments
+
+
+COLUMNS = ('video_id', 'comment_id', 'parent_id', 'author', 'text', 'likes', 'like_count', 'published')
+# Options that must match to resume from a checkpoint
+CHECKPOINT_OPTIONS = ('format', 'gzip', 'order', 'max_replies')
+
+
+def comment_rows(video_id, page_comments):
+    """Normalized export rows for a page; replies follow their parent"""
+    for comment in page_comments:
+        yield _row(video_id, comment, None)
+        for reply in comment.get('replies') or []:
+            yield _row(video_id, reply, comment['comment_id'])
+
+
+def _row(video_id, comment, parent_id):
+    return {
+        'video_id': video_id,
+        'comment_id': comment['comment_id'],
+        'parent_id': parent_id,
+        'author': comment['author'],
+        'text': comment['text'],
+        'likes': comment['likes'],
+        'like_count': _model.parse_likes(comment['likes']),
+        'published': comment['published']
+    }
+
+
+class PartWriter:
+    """
+    Buffered writer for the rotating part files of one video. Each flush
+    is written in one go (one gzip member with --gzip), so a part can be
+    cut back to any flush boundary and appended to.
+    """
+
+    def __init__(self, directory, fmt='ndjson', compress=False, rotate_rows=1000000,
+                 part=0, offset=0, part_rows=0):
+        self.directory = directory
+        self.format = fmt
+        self.compress = compress
+        self.rotate_rows = rotate_rows
+        self.part = part
+        self.offset = offset
+        self.part_rows = part_rows
+        self.pending = 0
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer, lineterminator='\n') if fmt == 'csv' else None
+        self._file = None
+
+    def path(self, part=None):
+        suffix = '.gz' if self.compress else ''
+        return os.path.join(self.directory, f'part-{self.part if part is None else part:05d}.{self.format}{suffix}')
+
+    def paths(self):
+        return [self.path(part) for part in range(self.part + 1) if os.path.exists(self.path(part))]
+
+    def add(self, row):
+        if self.pending == 0 and self.part_rows == 0 and self._csv is not None:
+            self._csv.writerow(COLUMNS)
+        if self._csv is not None:
+            self._csv.writerow([row[column] for column in COLUMNS])
+        else:
+            self._buffer.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.pending += 1
+
+    def flush(self):
+        """Write buffered rows and sync them to disk; rotate if the part is full"""
+        if not self.pending:
+            return
+        data = self._buffer.getvalue().encode('utf-8')
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if self.compress:
+            data = gzip.compress(data)
+
+        if self._file is None:
+            self._file = self._open()
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.offset = self._file.tell()
+        self.part_rows += self.pending
+        self.pending = 0
+
+        if self.part_rows >= self.rotate_rows:
+            self.close()
+            self.part += 1
+            self.offset = 0
+            self.part_rows = 0
+
+    def _open(self):
+        path = self.path()
+        if self.offset and os.path.exists(path):
+            # Drop anything written after the last checkpoint
+            f = open(path, 'r+b')
+            f.truncate(self.offset)
+            f.seek(self.offset)
+            return f
+        return open(path, 'wb')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def state(self):
+        return {'part': self.part, 'offset': self.offset, 'part_rows': self.part_rows}
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def export_video(video_id, out_dir='exports', fmt='ndjson', compress=False, order='top', max_replies=0,
+                 max_results=None, rotate_rows=1000000, flush_rows=1000, restart=False):
+    """Export one video's comments, resuming from its checkpoint if there is one"""
+    directory = os.path.join(out_dir, video_id)
+    os.makedirs(directory, exist_ok=True)
+    checkpoint_path = os.path.join(directory, 'checkpoint.json')
+    options = {'format': fmt, 'gzip': compress, 'order': order, 'max_replies': max_replies}
+
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        if any(checkpoint.get(name) != options[name] for name in CHECKPOINT_OPTIONS):
+            return {
+                'success': False,
+                'error': 'Checkpoint was written with different options; use --restart',
+                'video_id': video_id
+            }
+        if checkpoint.get('done'):
+            return {
+                'success': True,
+                'video_id': video_id,
+                'count': checkpoint['count'],
+                'rows': checkpoint['rows'],
+                'skipped': True
+            }
+    else:
+        for path in glob.glob(os.path.join(directory, 'part-*')):
+            os.remove(path)
+
+    state = checkpoint or {}
+    writer = PartWriter(directory, fmt, compress, rotate_rows,
+                        state.get('part', 0), state.get('offset', 0), state.get('part_rows', 0))
+    rows = state.get('rows', 0)
+    count = state.get('count', 0)
+
+    def save(next_token, done=False):
+        writer.flush()
+        checkpoint = dict(options, video_id=video_id, next_token=next_token, rows=rows, count=count,
+                          done=done, **writer.state())
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    remaining = None if max_results is None else max_results - count
+    if checkpoint is not None:
+        pages = comments.iter_comment_pages(checkpoint['next_token'], remaining, max_replies=max_replies)
+    else:
+        try:
+            first_page = comments.fetch_first_page(video_id, order)
+        except comments.FetchError as e:
+            return {'success': False, 'error': str(e), 'video_id': video_id}
+        if first_page is None:
+            save(None, done=True)
+            writer.close()
+            return {'success': True, 'video_id': video_id, 'count': 0, 'files': []}
+        pages = comments.iter_comment_pages(None, remaining, first_page, max_replies)
+
+    # Token to resume from once everything buffered so far is on disk
+    next_token = state.get('next_token')
+    try:
+        for page_comments, next_token in pages:
+            for row in comment_rows(video_id, page_comments):
+                writer.add(row)
+                rows += 1
+            count += len(page_comments)
+            if writer.pending >= flush_rows:
+                save(next_token)
+    except comments.FetchError as e:
+        save(next_token)
+        writer.close()
+        return {'success': False, 'error': str(e), 'video_id': video_id, 'count': count, 'resumable': True}
+    except BaseException:
+        # Interrupted, maybe halfway through a page: leave the last
+        # checkpoint as it is and refetch whatever was still buffered
+        writer.close()
+        raise
+
+    save(None, done=True)
+    writer.close()
+    return {
+        'success': True,
+        'video_id': video_id,
+        'count': count,
+        'rows': rows,
+        'resumed': checkpoint is not None,
+        'files': writer.paths()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export video comments to NDJSON or CSV files')
+    parser.add_argument('videos', nargs='+', help='YouTube URLs or video IDs')
+    parser.add_argument('--out', default='exports', help='Output directory')
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--gzip', action='store_true', help='gzip-compress the part files')
+    parser.add_argument('--order', choices=('top', 'newest'), default='top')
+    parser.add_argument('--replies', action='store_true', help='Also export replies (parent_id is set)')
+    parser.add_argument('--max-replies', type=int, default=comments.MAX_REPLIES_LIMIT)
+    parser.add_argument('--max', type=int, default=None, help='Comments per video (default: all)')
+    parser.add_argument('--rotate-rows', type=int, default=1000000, help='Rows per part file')
+    parser.add_argument('--flush-rows', type=int, default=1000, help='Rows per write and checkpoint')
+    parser.add_argument('--workers', type=int, default=1, help='Videos exported in parallel')
+    parser.add_argument('--restart', action='store_true', help='Ignore checkpoints and start over')
+    args = parser.parse_args()
+
+    video_ids = []
+    failed = False
+    for video in args.videos:
+        video_id = comments.extract_video_id(video)
+        if video_id:
+            video_ids.append(video_id)
+        else:
+            print(json.dumps({'success': False, 'error': 'Invalid YouTube URL or video ID', 'url': video}))
+            failed = True
+
+    def export(video_id):
+        return export_video(video_id, args.out, args.format, args.gzip, args.order,
+                            args.max_replies if args.replies else 0, args.max,
+                            args.rotate_rows, args.flush_rows, args.restart)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        for result in executor.map(export, video_ids):
+            print(json.dumps(result), flush=True)
+            failed = failed or not result['success']
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
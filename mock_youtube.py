@@ -0,0 +1,214 @@
+"""
+Local stand-in for YouTube, for end-to-end and load tests.
+
+    python mock_youtube.py [--port 9000] [--comments 1000] [--per-page 20]
+                           [--latency 50] [--jitter 20] [--error-rate 0.01]
+                           [--rate-limit-rate 0.02] [--fixtures bench/fixtures]
+                           [--no-gzip]
+
+Serves watch pages and paginated /youtubei/v1/next responses. These are
+synthetic (bench/payloads.py), or recorded fixtures with --fixtures.
+Every response waits --latency +/- --jitter ms. A share of /next calls
+fail with 500 (--error-rate) or 429 with Retry-After (--rate-limit-rate).
+Bodies are gzipped for clients that accept it, like YouTube does, unless
+--no-gzip. GET /__stats returns the request counters.
+
+Point the API at it with YOUTUBE_BASE_URL=http://127.0.0.1:9000.
+"""
+from urllib.parse import unquote, urlencode
+import argparse
+import asyncio
+import base64
+import functools
+import gzip
+import json
+import random
+import re
+
+from api import _replay, _upstream
+from bench import payloads
+import server
+
+
+# Bodies smaller than this are sent uncompressed
+MIN_GZIP_SIZE = 1024
+
+# Video ID inside a synthesized comments token (see _tokens.comments_section_token)
+_TOKEN_VIDEO_RE = re.compile(rb'\x12\x0b([A-Za-z0-9_-]{11})')
+
+
+class MockYouTube:
+    def __init__(self, comments=1000, per_page=20, replies=5, latency=0.0, jitter=0.0,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1, fixtures=None, compress=True):
+        self.comments = comments
+        self.per_page = per_page
+        self.replies = replies
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.fixtures = _replay.ReplayTransport(fixtures) if fixtures else None
+        self.compress = compress
+        self.stats = {'watch': 0, 'next': 0, 'replies': 0, 'errors': 0, 'rate_limited': 0, 'not_found': 0}
+
+    async def handle(self, request):
+        """Return (status, headers, body) for a request"""
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if request.path == '/__stats':
+            return 200, {'Content-Type': 'application/json'}, json.dumps(self.stats).encode()
+
+        if self.fixtures is not None:
+            return self._replay(request)
+
+        if request.path == '/watch':
+            self.stats['watch'] += 1
+            video_id = request.params.get('v', [''])[0]
+            return 200, {'Content-Type': 'text/html; charset=utf-8'}, self.watch_page(video_id)
+
+        if request.path == '/youtubei/v1/next' and request.method == 'POST':
+            failure = self._failure()
+            if failure is not None:
+                return failure
+            try:
+                payload = json.loads(request.body or b'{}')
+            except ValueError:
+                return 400, {'Content-Type': 'application/json'}, b'{"error":"bad request"}'
+            token = payload.get('continuation') or ''
+            if token.startswith('replies-'):
+                self.stats['replies'] += 1
+                return 200, {'Content-Type': 'application/json'}, self.reply_page(token)
+            self.stats['next'] += 1
+            video_id, page = self.parse_token(token or payload.get('videoId', ''))
+            return 200, {'Content-Type': 'application/json'}, self.next_page(video_id, page)
+
+        self.stats['not_found'] += 1
+        return 404, {'Content-Type': 'text/plain'}, b'Not found'
+
+    def _failure(self):
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.stats['rate_limited'] += 1
+            return 429, {'Content-Type': 'application/json', 'Retry-After': str(self.retry_after)}, b'{}'
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats['errors'] += 1
+            return 500, {'Content-Type': 'application/json'}, b'{}'
+        return None
+
+    def _replay(self, request):
+        url = request.path
+        if request.params:
+            url += '?' + urlencode(request.params, doseq=True)
+        if request.path.endswith('/next'):
+            failure = self._failure()
+            if failure is not None:
+                return failure
+        try:
+            response = self.fixtures.request(request.method, url, body=request.body or None)
+        except LookupError:
+            self.stats['not_found'] += 1
+            return 404, {'Content-Type': 'text/plain'}, b'No fixture'
+        except _upstream.UpstreamHTTPError as e:
+            return e.status, {'Content-Type': 'text/plain'}, b''
+        self.stats['watch' if request.path == '/watch' else 'next'] += 1
+        return response.status, {'Content-Type': response.headers.get('Content-Type', 'application/json')}, response.read()
+
+    def parse_token(self, token):
+        """(video_id, page) from one of our page tokens or a synthesized first-page token"""
+        if token.startswith('mock:'):
+            _, video_id, page = token.split(':')
+            return video_id, int(page)
+        if len(token) == 11:
+            return token, 0
+        try:
+            raw = base64.urlsafe_b64decode(unquote(token) + '===')
+        except ValueError:
+            raw = b''
+        match = _TOKEN_VIDEO_RE.search(raw)
+        return (match.group(1).decode() if match else 'unknown'), 0
+
+    @functools.lru_cache(maxsize=1024)
+    def watch_page(self, video_id):
+        return payloads.watch_page(token=f'mock:{video_id}:0', size=256 * 1024)
+
+    @functools.lru_cache(maxsize=4096)
+    def next_page(self, video_id, page):
+        pages = max(1, -(-self.comments // self.per_page))
+        per_page = min(self.per_page, self.comments - page * self.per_page)
+        next_token = f'mock:{video_id}:{page + 1}' if page + 1 < pages else None
+        data = payloads.entity_page(page, max(0, per_page), next_token)
+        if page == 0:
+            # First pages replace the comments section rather than append to it
+            action = data['onResponseReceivedEndpoints'][0]
+            action['reloadContinuationItemsCommand'] = action.pop('appendContinuationItemsAction')
+        return json.dumps(data).encode('utf-8')
+
+    @functools.lru_cache(maxsize=1024)
+    def reply_page(self, token):
+        return json.dumps(payloads.entity_page(0, self.replies, None, replies=False)).encode('utf-8')
+
+
+async def handle_connection(mock, reader, writer):
+    try:
+        while True:
+            request = await server.read_request(reader)
+            if request is None:
+                break
+            status, headers, body = await mock.handle(request)
+            if (mock.compress and len(body) >= MIN_GZIP_SIZE
+                    and 'gzip' in request.headers.get('accept-encoding', '')):
+                body = gzip.compress(body, compresslevel=1)
+                headers['Content-Encoding'] = 'gzip'
+            lines = [f'HTTP/1.1 {status} {STATUS_REASONS.get(status, "OK")}', f'Content-Length: {len(body)}']
+            lines.extend(f'{name}: {value}' for name, value in headers.items())
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+            if not request.keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+STATUS_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 429: 'Too Many Requests',
+                  500: 'Internal Server Error'}
+
+
+async def serve(mock, host, port):
+    srv = await asyncio.start_server(functools.partial(handle_connection, mock), host, port)
+    print(f'Mock YouTube on http://{host}:{port}')
+    async with srv:
+        await srv.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for YouTube')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--comments', type=int, default=1000, help='Comments per video')
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--replies', type=int, default=5, help='Replies per reply page')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean response delay in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform +/- delay in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of /next calls that return 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of /next calls that return 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds on 429')
+    parser.add_argument('--fixtures', help='Serve recorded fixtures instead of synthetic pages')
+    parser.add_argument('--no-gzip', action='store_true', help='Never compress response bodies')
+    args = parser.parse_args()
+
+    mock = MockYouTube(args.comments, args.per_page, args.replies, args.latency / 1000, args.jitter / 1000,
+                       args.error_rate, args.rate_limit_rate, args.retry_after, args.fixtures,
+                       not args.no_gzip)
+    try:
+        asyncio.run(serve(mock, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
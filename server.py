@@ -0,0 +1,357 @@
+"""
+Local asyncio HTTP server serving the same routes as the Vercel handlers,
+backed by the async fetch engine in api/_aio.py.
+
+    python server.py [--host 127.0.0.1] [--port 8000]
+"""
+from urllib.parse import urlparse, parse_qs
+import argparse
+import asyncio
+import json
+
+from api import _aio, _crawl, _metrics, _responses, _service, _static, comments, index, youtube
+
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Expose-Headers': 'ETag, Server-Timing, X-Cache'
+}
+
+STATUS_REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request'}
+
+# Strong references to fire-and-forget tasks so they aren't collected early
+_background_tasks = set()
+
+
+class Request:
+    """A parsed HTTP request. error is set if it can't be served, like a bad Content-Length."""
+
+    def __init__(self, method, target, version, headers, body, error=None):
+        self.method = method
+        self.version = version
+        self.headers = headers
+        self.body = body
+        self.error = error
+        parsed = urlparse(target)
+        self.path = parsed.path
+        self.params = parse_qs(parsed.query)
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.1':
+            return connection != 'close'
+        return connection == 'keep-alive'
+
+
+class Responder:
+    """Writes responses for one request on a client connection"""
+
+    def __init__(self, request, writer):
+        self.request = request
+        self.writer = writer
+        self.keep_alive = request.keep_alive
+        self._chunked = False
+
+    def _head(self, status, headers):
+        lines = [f'{self.request.version} {status} {STATUS_REASONS.get(status, "OK")}']
+        for name, value in headers.items():
+            lines.append(f'{name}: {value}')
+        lines.append('Connection: keep-alive' if self.keep_alive else 'Connection: close')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    async def send(self, body, content_type='application/json', headers=None, status=200):
+        """Send a complete response"""
+        all_headers = {'Content-Type': content_type}
+        if status != 304:
+            all_headers['Content-Length'] = str(len(body))
+        all_headers.update(CORS_HEADERS)
+        all_headers.update(headers or {})
+        self._head(status, all_headers)
+        self.writer.write(body)
+        await self.writer.drain()
+
+    async def send_json(self, obj, headers=None, indent=None, status=200):
+        """Send obj as JSON, compact unless indent is given, like comments.handler"""
+        body = json.dumps(obj, indent=indent).encode() if indent else _responses.dumps(obj)
+        await self.send_encoded(body, headers, status=status)
+
+    async def send_encoded(self, body, headers=None, cache_control=None, status=200):
+        """Send bytes or an EncodedBody, negotiated as in comments.handler._send_json"""
+        pretty = self.request.params.get('pretty', ['0'])[0] in ('1', 'true')
+        prepared, data, negotiated = _responses.prepare(body, self.request.headers, cache_control, pretty)
+        if prepared == 304:
+            status = 304
+        negotiated.update(headers or {})
+        await self.send(data, headers=negotiated, status=status)
+
+    async def send_static(self, asset, body):
+        """
+        Send a static asset's cached body. Large uncompressed bodies are
+        written from the file with sendfile instead of from memory.
+        """
+        status, data, headers = _responses.prepare(body, self.request.headers, asset.cache_control)
+        f = None
+        if status == 200 and 'Content-Encoding' not in headers:
+            f = asset.open_unchanged(body)
+        if f is None:
+            await self.send(data, content_type=asset.content_type, headers=headers, status=status)
+            return
+        with f:
+            all_headers = {'Content-Type': asset.content_type, 'Content-Length': str(len(data))}
+            all_headers.update(CORS_HEADERS)
+            all_headers.update(headers)
+            self._head(status, all_headers)
+            await self.writer.drain()
+            # os.sendfile() on plain sockets; read-and-write fallback otherwise (e.g. TLS)
+            await asyncio.get_running_loop().sendfile(self.writer.transport, f, 0, len(data))
+
+    async def start_ndjson(self, status=200):
+        """Start a streamed NDJSON response (chunked on HTTP/1.1)"""
+        self._chunked = self.request.version == 'HTTP/1.1'
+        if not self._chunked:
+            self.keep_alive = False
+        headers = {'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache'}
+        headers.update(CORS_HEADERS)
+        if self._chunked:
+            headers['Transfer-Encoding'] = 'chunked'
+        self._head(status, headers)
+        await self.writer.drain()
+
+    async def write_line(self, obj):
+        line = _service.ndjson_line(obj)
+        if self._chunked:
+            self.writer.write(b'%x\r\n%s\r\n' % (len(line), line))
+        else:
+            self.writer.write(line)
+        await self.writer.drain()
+
+    async def end_ndjson(self):
+        if self._chunked:
+            self.writer.write(b'0\r\n\r\n')
+            await self.writer.drain()
+
+
+async def read_request(reader):
+    """Read one request from the connection, or None at end of stream"""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = _service.content_length(headers.get('content-length'))
+    if length is None:
+        return Request(method, target, version, headers, b'', error='Invalid Content-Length')
+    body = await reader.readexactly(length) if length else b''
+    return Request(method, target, version, headers, body)
+
+
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            request = await read_request(reader)
+            if request is None:
+                break
+            responder = Responder(request, writer)
+            if request.error:
+                # The body can't be told from the next request; answer and close
+                responder.keep_alive = False
+                await responder.send_json({'success': False, 'error': request.error}, status=400)
+                break
+            await route(request, responder)
+            if not responder.keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def route(request, responder):
+    if request.method == 'OPTIONS':
+        await responder.send(b'', content_type='text/plain')
+        return
+
+    if request.method == 'POST':
+        if request.path == '/comments/batch':
+            await stream_batch(request, responder)
+        else:
+            await responder.send_json({'success': False, 'error': 'Not found'})
+        return
+
+    # Root endpoint - Serve HTML page
+    if request.path == '/':
+        page = _static.INDEX.get()
+        if page is not None:
+            await responder.send_static(_static.INDEX, page)
+            return
+
+    if request.path == '/comments':
+        await get_comments(request, responder)
+    elif request.path == '/stats':
+        stats = comments.collect_stats()
+        stats['async_pool'] = _aio.get_pool().stats()
+        await responder.send_json(stats, indent=2)
+    elif request.path == '/metrics':
+        await responder.send(_metrics.render().encode(), content_type=_metrics.CONTENT_TYPE)
+    elif request.path in ('/api/youtube/comments', '/api/comments'):
+        await get_legacy_comments(request, responder)
+    else:
+        await responder.send_json({'success': False, 'error': 'Not found'})
+
+
+async def get_comments(request, responder):
+    """GET /comments, like comments.handler"""
+    timings = _metrics.start_request()
+    comments_request = _service.CommentsRequest(request.params)
+
+    if comments_request.ndjson:
+        await responder.start_ndjson(comments_request.status)
+        if comments_request.error:
+            await responder.write_line(comments_request.error_result())
+        else:
+            lines = _crawl.iterate_async(comments_request.lines(), _aio.perform)
+            try:
+                async for line in lines:
+                    await responder.write_line(line)
+            finally:
+                # Stops the crawl when the client is gone
+                await lines.aclose()
+        await responder.end_ndjson()
+        _metrics.finish_request('comments_stream', timings)
+        return
+
+    if comments_request.error:
+        await responder.send_json(comments_request.error_result(), status=comments_request.status)
+        return
+
+    video_id = comments_request.video_id
+    if comments_request.sync:
+        # SQLite and the sync crawler are blocking; keep them off the loop
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, comments.sync_result, video_id, comments_request.max_results)
+        await responder.send_encoded(_responses.dumps(result), cache_control='no-store')
+        return
+
+    key = comments_request.cache_key
+
+    async def load():
+        return _service.encode_result(await _crawl.run_async(comments_request.fetch(), _aio.perform))
+
+    body, state, refresh = _service.RESPONSE_CACHE.lookup(key)
+    if refresh:
+        spawn(refresh_cache_entry(key, load))
+    if state is None:
+        body, size = await _service.REQUEST_FLIGHTS.do_async(key, load)
+        if size is not None:
+            _service.RESPONSE_CACHE.set(key, body, size)
+        state = 'MISS'
+    timings.note('cache', state)
+    await responder.send_encoded(body, {'X-Cache': state, 'Server-Timing': timings.header()},
+                                 _service.cache_control(body))
+    _metrics.finish_request('comments', timings, state)
+
+
+async def refresh_cache_entry(key, load):
+    """Reload a stale cache entry in the background"""
+    try:
+        body, size = await _service.REQUEST_FLIGHTS.do_async(key, load)
+    except Exception:
+        size = None
+    # An uncacheable result (size None, e.g. an error) leaves the stale entry in place
+    if size is not None:
+        _service.RESPONSE_CACHE.set(key, body, size)
+    _service.RESPONSE_CACHE.refresh_done(key, ok=size is not None)
+
+
+async def stream_batch(request, responder):
+    """POST /comments/batch, like comments.handler"""
+    timings = _metrics.start_request()
+    batch = _service.BatchRequest(request.body)
+    if batch.error:
+        await responder.send_json(batch.error_result(), status=batch.status)
+        return
+
+    await responder.start_ndjson()
+    for line in batch.invalid_lines():
+        await responder.write_line(line)
+
+    semaphore = asyncio.Semaphore(_service.BATCH_WORKERS)
+
+    async def fetch(video_id):
+        async with semaphore:
+            return await _crawl.run_async(batch.fetch(video_id), _aio.perform)
+
+    tasks = [asyncio.ensure_future(fetch(video_id)) for video_id in batch.video_ids]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            await responder.write_line(await next_done)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    await responder.write_line(batch.summary())
+    await responder.end_ndjson()
+    _metrics.finish_request('batch', timings)
+
+
+async def get_legacy_comments(request, responder):
+    """The api/youtube.py and api/index.py comment routes, run in a thread"""
+    url_param = request.params.get('url', [None])[0]
+    if not url_param:
+        await responder.send_json({'error': 'Missing required parameter: url'})
+        return
+    try:
+        max_results = int(request.params.get('max_results', [100])[0])
+    except ValueError:
+        max_results = 100
+
+    module = youtube if request.path == '/api/youtube/comments' else index
+    video_id = module.extract_video_id(url_param)
+    if not video_id:
+        await responder.send_json({'error': 'Invalid YouTube URL or video ID'})
+        return
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, module.get_youtube_comments, video_id, max_results)
+    await responder.send_encoded(youtube.encode_result(result),
+                                 cache_control='no-store' if 'error' in result else youtube.CACHE_CONTROL)
+
+
+def spawn(coro):
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def serve(host, port):
+    server = await asyncio.start_server(handle_connection, host, port)
+    print(f'Serving on http://{host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the comments API on a local asyncio server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
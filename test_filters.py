@@ -0,0 +1,88 @@
+"""
+Offline checks for api._filters: matching, top-K selection and its
+tie-breaking (the comment seen first wins a tie and is listed first).
+
+Run with: python test_filters.py (or pytest)
+"""
+from api import _filters
+
+
+def _comment(comment_id, likes='0', published='1 day ago', author='@viewer', text='hello'):
+    return {'comment_id': comment_id, 'author': author, 'text': text, 'likes': likes, 'published': published}
+
+
+def _select(comment_filter, comments):
+    selection = comment_filter.selection()
+    for comment in comments:
+        selection.add(comment)
+    return [comment['comment_id'] for comment in selection.results()], selection
+
+
+def test_top_k_by_likes():
+    comments = [_comment(f'c{i}', likes) for i, likes in enumerate(['5', '1.2K', '30', '2', '999'])]
+    ids, selection = _select(_filters.CommentFilter(sort='likes', top=3), comments)
+    assert ids == ['c1', 'c4', 'c2']
+    assert selection.scanned == 5
+
+
+def test_ties_go_to_the_first_seen():
+    comments = [_comment(f'c{i}', likes) for i, likes in enumerate(['7', '7', '9', '7', '7'])]
+    ids, _ = _select(_filters.CommentFilter(sort='likes', top=3), comments)
+    assert ids == ['c2', 'c0', 'c1']
+    # Without top every match is kept, ties still in crawl order
+    ids, _ = _select(_filters.CommentFilter(sort='likes'), comments)
+    assert ids == ['c2', 'c0', 'c1', 'c3', 'c4']
+
+
+def test_a_later_tie_does_not_replace():
+    comments = [_comment('first', '10'), _comment('second', '10')]
+    ids, _ = _select(_filters.CommentFilter(sort='likes', top=1), comments)
+    assert ids == ['first']
+
+
+def test_sort_by_published():
+    ages = ['3 weeks ago', '2 hours ago', '1 year ago', '5 days ago (edited)', '']
+    comments = [_comment(f'c{i}', published=age) for i, age in enumerate(ages)]
+    ids, _ = _select(_filters.CommentFilter(sort='published', top=4), comments)
+    assert ids == ['c1', 'c3', 'c0', 'c2']
+
+
+def test_unsorted_top_stops_the_crawl():
+    comment_filter = _filters.CommentFilter(top=2, min_likes=10)
+    selection = comment_filter.selection()
+    offered = 0
+    for comment in [_comment('a', '5'), _comment('b', '10'), _comment('c', '50'), _comment('d', '99')]:
+        if selection.done:
+            break
+        selection.add(comment)
+        offered += 1
+    assert offered == 3
+    assert [comment['comment_id'] for comment in selection.results()] == ['b', 'c']
+
+
+def test_matches():
+    comment_filter = _filters.CommentFilter(min_likes=100, author='Viewer', q='GREAT')
+    assert comment_filter.matches(_comment('a', '1K', author='@viewer', text='a great video'))
+    assert not comment_filter.matches(_comment('b', '99', author='@viewer', text='great'))
+    assert not comment_filter.matches(_comment('c', '1K', author='@other', text='great'))
+    assert not comment_filter.matches(_comment('d', '1K', author='@viewer', text='fine'))
+
+
+def test_from_params():
+    assert _filters.from_params({}) is None
+    assert _filters.from_params({'sort': ['random']}) is None
+    comment_filter = _filters.from_params({'sort': ['likes'], 'top': ['5'], 'min_likes': ['-3']})
+    assert comment_filter.key == ('likes', 5, 0, None, None)
+    for top in ('0', '-1', 'abc'):
+        try:
+            _filters.from_params({'top': [top]})
+        except ValueError:
+            continue
+        raise AssertionError(f'top={top} accepted')
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'{name}: ok')
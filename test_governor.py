@@ -0,0 +1,169 @@
+"""
+Offline checks for api._governor: the AIMD back-off and recovery rules,
+run against a fake clock so nothing sleeps.
+
+Run with: python test_governor.py (or pytest)
+"""
+from email.utils import formatdate
+import time
+
+from api import _governor
+
+HOST = 'www.youtube.com'
+
+
+class FakeClock:
+    """Stands in for the time module inside _governor"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return time.time()
+
+
+def _governor_with_clock(**kwargs):
+    clock = FakeClock()
+    _governor.time = clock
+    return _governor.Governor(**kwargs), clock
+
+
+def teardown_function(function):
+    _governor.time = time
+
+
+def _fill(governor, host=HOST):
+    """Take permits until one is refused; returns how many were given"""
+    taken = 0
+    while governor.try_acquire(host) == 0.0:
+        taken += 1
+    return taken
+
+
+def test_concurrency_limit():
+    governor, _ = _governor_with_clock(rate=0, max_concurrency=2)
+    assert _fill(governor) == 2
+    assert governor.try_acquire(HOST) == _governor._POLL_INTERVAL
+    governor.release(HOST, 200)
+    assert governor.try_acquire(HOST) == 0.0
+
+
+def test_token_bucket():
+    governor, clock = _governor_with_clock(rate=2.0, burst=3, max_concurrency=100)
+    assert _fill(governor) == 3
+    assert abs(governor.try_acquire(HOST) - 0.5) < 1e-9
+    clock.now += 0.5
+    assert governor.try_acquire(HOST) == 0.0
+    assert governor.try_acquire(HOST) > 0
+
+
+def test_429_pauses_and_cuts_rate_and_concurrency():
+    governor, clock = _governor_with_clock(rate=10.0, max_concurrency=8)
+    governor.try_acquire(HOST)
+    governor.release(HOST, 429, retry_after=3.0)
+    stats = governor.stats()[HOST]
+    assert stats['limit'] == 4 and stats['rate'] == 5 and stats['throttled'] == 1
+    assert abs(governor.try_acquire(HOST) - 3.0) < 1e-9
+    clock.now += 3.0
+    assert governor.try_acquire(HOST) == 0.0
+
+
+def test_retry_after_is_capped():
+    governor, _ = _governor_with_clock(rate=0, backoff_cap=5.0)
+    governor.try_acquire(HOST)
+    governor.release(HOST, 429, retry_after=3600)
+    assert abs(governor.try_acquire(HOST) - 5.0) < 1e-9
+
+
+def test_5xx_cuts_concurrency_only():
+    governor, _ = _governor_with_clock(rate=10.0, max_concurrency=8)
+    governor.try_acquire(HOST)
+    governor.release(HOST, 503)
+    stats = governor.stats()[HOST]
+    assert stats['limit'] == 4 and stats['rate'] == 10 and stats['errors'] == 1
+    assert stats['paused_for'] == 0
+    # A failure without a response counts the same
+    governor.try_acquire(HOST)
+    governor.release(HOST, None)
+    assert governor.stats()[HOST]['errors'] == 2
+
+
+def test_burst_of_failures_is_one_decrease():
+    governor, clock = _governor_with_clock(rate=0, max_concurrency=16, backoff_base=0.5)
+    _fill(governor)
+    for _ in range(5):
+        governor.release(HOST, 500)
+    assert governor.stats()[HOST]['limit'] == 8
+    clock.now += 0.5
+    governor.release(HOST, 500)
+    assert governor.stats()[HOST]['limit'] == 4
+
+
+def test_floors():
+    governor, clock = _governor_with_clock(rate=4.0, min_rate=1.0, max_concurrency=8, min_concurrency=2)
+    for _ in range(10):
+        clock.now += 1.0
+        governor.release(HOST, 429, retry_after=0)
+    stats = governor.stats()[HOST]
+    assert stats['limit'] == 2 and stats['rate'] == 1
+
+
+def test_recovery_is_additive_and_capped():
+    governor, clock = _governor_with_clock(rate=0, max_concurrency=8, increase=1.0)
+    governor.release(HOST, 500)
+    assert governor.stats()[HOST]['limit'] == 4
+    # One limit's worth of successes grows the limit by about one
+    for _ in range(4):
+        governor.release(HOST, 200)
+    assert 4.9 < governor.stats()[HOST]['limit'] < 5.0
+    for _ in range(1000):
+        governor.release(HOST, 200)
+    assert governor.stats()[HOST]['limit'] == 8
+
+
+def test_success_resets_failures():
+    governor, _ = _governor_with_clock(rate=0)
+    governor.release(HOST, 500)
+    governor.release(HOST, 500)
+    governor.release(HOST, 200)
+    assert governor._host(HOST).failures == 0
+
+
+def test_hosts_are_independent():
+    governor, _ = _governor_with_clock(rate=0, max_concurrency=1)
+    assert governor.try_acquire(HOST) == 0.0
+    governor.release(HOST, 429, retry_after=10)
+    assert governor.try_acquire(HOST) > 0
+    assert governor.try_acquire('i.ytimg.com') == 0.0
+
+
+def test_retry_delay():
+    governor, _ = _governor_with_clock(backoff_base=0.5, backoff_cap=4.0)
+    for _ in range(100):
+        assert 2.0 <= governor.retry_delay(HOST, 1, retry_after=2.0) <= 2.5
+        assert 4.0 <= governor.retry_delay(HOST, 1, retry_after=60) <= 4.5
+        assert 0 <= governor.retry_delay(HOST, 10) <= 4.0
+    assert governor.stats()[HOST]['retries'] == 300
+
+
+def test_retry_after_seconds():
+    assert _governor.retry_after_seconds({'Retry-After': '7'}) == 7.0
+    assert _governor.retry_after_seconds({'retry-after': '-3'}) == 0.0
+    assert _governor.retry_after_seconds({'Retry-After': 'soon'}) is None
+    assert _governor.retry_after_seconds({}) is None
+    assert _governor.retry_after_seconds(None) is None
+    seconds = _governor.retry_after_seconds({'Retry-After': formatdate(time.time() + 60, usegmt=True)})
+    assert 55 < seconds <= 60
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            try:
+                test()
+            finally:
+                teardown_function(test)
+            print(f'{name}: ok')
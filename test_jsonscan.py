@@ -0,0 +1,91 @@
+"""
+Offline checks for api._jsonscan: the incremental scanner must give the
+same comments as json.loads, however the body is split into chunks.
+
+Run with: python test_jsonscan.py (or pytest)
+"""
+import io
+import json
+
+from api import _jsonscan, _parse
+from bench import payloads
+
+CHUNK_SIZES = (1, 7, 64, 4096, 1 << 20)
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _scanned(body, chunk_size):
+    return _jsonscan.scan_page(io.BytesIO(body), chunk_size, min_scan_size=0)
+
+
+def _tricky_page():
+    # Capture keys inside strings, escaped quotes, and multi-byte characters
+    # that chunk boundaries will split
+    page = payloads.renderer_page(per_page=3)
+    items = page['onResponseReceivedEndpoints'][0]['appendContinuationItemsAction']['continuationItems']
+    renderer = items[0]['commentThreadRenderer']['comment']['commentRenderer']
+    renderer['contentText'] = {'runs': [{'text': 'say "commentRenderer": {} \\" ok ✓ 日本語 😀'}]}
+    page['responseContext'] = {'note': '"continuationItemRenderer": [', 'emoji': '😀' * 50}
+    return page
+
+
+def _check(page):
+    for ensure_ascii in (True, False):
+        body = json.dumps(page, ensure_ascii=ensure_ascii).encode('utf-8')
+        expected_tokens = {}
+        expected = _parse.parse_page(json.loads(body), reply_tokens=expected_tokens)
+        for size in CHUNK_SIZES:
+            reply_tokens = {}
+            comments, token = _parse.parse_page(_scanned(body, size), reply_tokens=reply_tokens)
+            assert (comments, token) == expected, (size, ensure_ascii)
+            assert reply_tokens == expected_tokens, (size, ensure_ascii)
+
+
+def test_renderer_page():
+    _check(payloads.renderer_page(per_page=10))
+
+
+def test_entity_page():
+    _check(payloads.entity_page(per_page=10))
+
+
+def test_tricky_strings():
+    _check(_tricky_page())
+
+
+def test_last_page_without_token():
+    _check(payloads.renderer_page(per_page=2, next_token=None))
+
+
+def test_captured_values_match_json_loads():
+    page = payloads.entity_page(per_page=4)
+    body = json.dumps(page).encode()
+    for size in CHUNK_SIZES:
+        scanner = _jsonscan.page_scanner()
+        events = []
+        for chunk in _chunks(body, size):
+            events.extend(scanner.feed(chunk))
+        events.extend(scanner.close())
+        payloads_seen = [value for key, value in events if key == 'commentEntityPayload']
+        expected = [mutation['payload']['commentEntityPayload']
+                    for mutation in page['frameworkUpdates']['entityBatchUpdate']['mutations']
+                    if 'commentEntityPayload' in mutation['payload']]
+        assert payloads_seen == expected, size
+        assert ('appendContinuationItemsAction', None) in events
+
+
+def test_small_bodies_use_json_loads():
+    page = payloads.renderer_page(per_page=2)
+    body = json.dumps(page).encode()
+    # Under the threshold the decoder returns the full json.loads result
+    assert _jsonscan.scan_page(io.BytesIO(body), 7) == page
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'{name}: ok')
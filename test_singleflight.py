@@ -0,0 +1,116 @@
+"""
+Offline checks for api._singleflight: concurrent calls share one execution,
+and cancelling one caller leaves the others their result.
+
+Run with: python test_singleflight.py (or pytest)
+"""
+import asyncio
+import threading
+import time
+
+from api._singleflight import SingleFlight
+
+
+def test_threads_share_one_call():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 'page'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('key', fetch)))
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=lambda: results.append(flights.do('key', fetch)))
+    follower.start()
+    while flights.coalesced == 0:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == ['page', 'page']
+    assert len(calls) == 1
+    assert flights.stats()['in_flight'] == 0
+
+
+async def _cancelled_leader():
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return 'page'
+
+    leader = asyncio.ensure_future(flights.do_async('key', fetch))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flights.do_async('key', fetch))
+    await asyncio.sleep(0)
+    assert flights.executions == 1 and flights.coalesced == 1
+
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await follower == 'page'
+    assert leader.cancelled()
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_cancelled_leader_leaves_follower_the_result():
+    asyncio.run(_cancelled_leader())
+
+
+async def _all_cancelled():
+    flights = SingleFlight()
+    stopped = asyncio.Event()
+
+    async def fetch():
+        try:
+            await asyncio.sleep(60)
+        finally:
+            stopped.set()
+
+    callers = [asyncio.ensure_future(flights.do_async('key', fetch)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.wait_for(stopped.wait(), 1)
+    assert flights.stats()['in_flight'] == 0
+
+    # A later call starts afresh rather than joining the cancelled one
+    async def fetch_again():
+        return 'fresh'
+
+    assert await flights.do_async('key', fetch_again) == 'fresh'
+
+
+def test_call_is_cancelled_once_nobody_waits():
+    asyncio.run(_all_cancelled())
+
+
+async def _errors_shared():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0)
+        raise ValueError('upstream')
+
+    results = await asyncio.gather(*(flights.do_async('key', fetch) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.executions == 1
+
+
+def test_async_error_reaches_every_caller():
+    asyncio.run(_errors_shared())
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'{name}: ok')
@@ -0,0 +1,90 @@
+"""
+Offline checks for api._tokens.comments_section_token: the synthesized
+token must decode to the protobuf layout the watch page uses.
+
+Run with: python test_tokens.py (or pytest)
+"""
+from urllib.parse import unquote
+import base64
+
+from api import _tokens
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def _decode(data):
+    """Protobuf bytes as {field: [value, ...]}; length-delimited values stay bytes"""
+    fields = {}
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        else:
+            raise AssertionError(f'unexpected wire type {wire_type}')
+        fields.setdefault(number, []).append(value)
+    return fields
+
+
+def _token_fields(token):
+    return _decode(base64.b64decode(unquote(token)))
+
+
+def test_layout():
+    for order, sort in _tokens.ORDERS.items():
+        message = _token_fields(_tokens.comments_section_token('dQw4w9WgXcQ', order))
+        assert _decode(message[2][0]) == {2: [b'dQw4w9WgXcQ']}
+        assert message[3] == [6]
+        params = _decode(message[6][0])
+        assert params[8] == [b'comments-section']
+        assert _decode(params[4][0]) == {4: [b'dQw4w9WgXcQ'], 6: [sort], 15: [2]}
+
+
+def test_url_safe():
+    # IDs with '-' and '_' and tokens whose base64 has '+', '/' or '='
+    for video_id in ('dQw4w9WgXcQ', 'a-b_c-d_e-f', '___________', '-----------'):
+        for order in _tokens.ORDERS:
+            token = _tokens.comments_section_token(video_id, order)
+            assert not set(token) & set('+/='), token
+            message = _token_fields(token)
+            assert _decode(message[2][0]) == {2: [video_id.encode()]}
+
+
+def test_orders_differ():
+    tokens = {_tokens.comments_section_token('dQw4w9WgXcQ', order) for order in _tokens.ORDERS}
+    assert len(tokens) == len(_tokens.ORDERS)
+
+
+def test_unknown_order():
+    try:
+        _tokens.comments_section_token('dQw4w9WgXcQ', 'oldest')
+    except KeyError:
+        return
+    raise AssertionError('unknown order accepted')
+
+
+def test_long_video_id_length_prefix():
+    # Lengths over 127 take a two-byte varint
+    video_id = 'x' * 200
+    message = _token_fields(_tokens.comments_section_token(video_id))
+    assert _decode(message[2][0]) == {2: [video_id.encode()]}
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'{name}: ok')